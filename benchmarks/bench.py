@@ -0,0 +1,177 @@
+"""Time every phase of the TinyGo pipeline on a corpus of programs.
+
+usage: python benchmarks/bench.py [--engines vm,tree,stack,python,jit] [--repeat N] [--warmup N]
+                                  [--save FILE] [--baseline FILE] [--threshold PCT]
+                                  [--filter TEXT] [--gen-funcs N]
+
+Each benchmark is a program from benchmarks/programs or a generated source
+for lexer and parser throughput. Every repeat lexes, parses, analyzes,
+compiles (vm) or transpiles (python) and runs it in this process; the JSON
+results keep the min and median seconds of each phase. With --baseline the medians are compared
+and the exit status is 1 when a phase got slower than the threshold.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from util.lexer import RegexLexer
+from util.parser import Parser
+from util.semantic_analyzer import SemanticAnalyzer
+from util.compiler import Compiler
+from util.transpiler import Transpiler
+from util.run import execute
+from util.stats import PhaseTimer, TokenBuffer
+from util.error import InterpretError
+from memory import make_source
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage=__doc__.split("\n\n")[1].replace("usage: ", ""))
+    parser.add_argument("--engines", default="vm,tree,stack,python,jit",
+                        help="comma separated engines to run (default vm,tree,stack,python,jit)")
+    parser.add_argument("--repeat", type=int, default=5, metavar="N",
+                        help="timed runs per benchmark (default 5)")
+    parser.add_argument("--warmup", type=int, default=1, metavar="N",
+                        help="untimed runs first (default 1)")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with results saved earlier")
+    parser.add_argument("--threshold", type=float, default=10.0, metavar="PCT",
+                        help="flag phases slower than the baseline by more than PCT percent (default 10)")
+    parser.add_argument("--min-time", type=float, default=0.001, metavar="SECONDS",
+                        help="ignore phases faster than this in both runs, they are noise (default 0.001)")
+    parser.add_argument("--filter", metavar="TEXT", help="only run benchmarks whose name contains TEXT")
+    parser.add_argument("--gen-funcs", type=int, default=2000, metavar="N",
+                        help="functions in the generated source (default 2000)")
+    return parser.parse_args()
+
+
+def corpus(gen_funcs):
+    programs = []
+    for path in sorted(glob.glob(os.path.join(BENCH_DIR, "programs", "*.go"))):
+        with open(path) as f:
+            programs.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+    source = make_source(gen_funcs) + "func main() int {\n\treturn 1\n}\n"
+    programs.append(("generated", source))
+    return programs
+
+
+def run_once(name, source, engine):
+    timer = PhaseTimer()
+    timer.start("lex")
+    lexer = TokenBuffer(RegexLexer(name, source + "\n"))
+    timer.start("parse")
+    tree = Parser(lexer).parse()
+    timer.start("analyze")
+    SemanticAnalyzer().analyze(tree)
+    program = tree
+    if engine == "vm":
+        timer.start("compile")
+        program = Compiler(tree).compile()
+    elif engine == "python":
+        timer.start("transpile")
+        program = Transpiler(tree, name).transpile()
+    timer.start("run")
+    result = execute(program, engine)
+    timer.stop()
+    return result, timer.phases
+
+
+def bench(name, source, engine, repeat, warmup):
+    for _ in range(warmup):
+        run_once(name, source, engine)
+    samples = {}
+    for _ in range(repeat):
+        result, phases = run_once(name, source, engine)
+        for phase, seconds in phases.items():
+            samples.setdefault(phase, []).append(seconds)
+    phases = {phase: {"min": min(times), "median": statistics.median(times)} for phase, times in samples.items()}
+    total = [sum(times) for times in zip(*samples.values())]
+    phases["total"] = {"min": min(total), "median": statistics.median(total)}
+    return {"result": result, "phases": phases}
+
+
+def compare(results, baseline, threshold, min_time):
+    """Print every phase against the baseline, return the regressed ones."""
+    regressions = []
+    print("\n%-22s %-8s %12s %12s %8s" % ("benchmark", "phase", "base ms", "now ms", "change"))
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print("%-22s (not in the baseline)" % key)
+            continue
+        if base["result"] != current["result"]:
+            print("%-22s result changed from %r to %r" % (key, base["result"], current["result"]))
+        for phase, stat in current["phases"].items():
+            if phase not in base["phases"]:
+                continue
+            before = base["phases"][phase]["median"]
+            now = stat["median"]
+            change = (now - before) / before * 100 if before else 0.0
+            flag = ""
+            if change > threshold and max(before, now) >= min_time:
+                flag = "REGRESSION"
+                regressions.append((key, phase, change))
+            elif change < -threshold and max(before, now) >= min_time:
+                flag = "faster"
+            print("%-22s %-8s %12.3f %12.3f %+7.1f%% %s" % (key, phase, before * 1000, now * 1000, change, flag))
+    return regressions
+
+
+def main():
+    args = parse_args()
+    engines = [engine for engine in args.engines.split(",") if engine]
+    results = {}
+    print("%-22s %-8s %12s %12s" % ("benchmark", "phase", "min ms", "median ms"))
+    for name, source in corpus(args.gen_funcs):
+        if args.filter and args.filter not in name:
+            continue
+        for engine in engines:
+            key = "%s/%s" % (name, engine)
+            try:
+                results[key] = bench(name, source, engine, args.repeat, args.warmup)
+            except RecursionError:
+                print("%-22s RecursionError, skipped" % key)
+                continue
+            except InterpretError as e:
+                # e.g. channels on the vm and python engines
+                print("%-22s %s, skipped" % (key, e.message))
+                continue
+            for phase, stat in results[key]["phases"].items():
+                print("%-22s %-8s %12.3f %12.3f" % (key, phase, stat["min"] * 1000, stat["median"] * 1000))
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold, args.min_time)
+        if regressions:
+            print("\n%d regression(s) above %g%%" % (len(regressions), args.threshold))
+            exit(1)
+        print("\nno regression above %g%%" % args.threshold)
+
+
+if __name__ == '__main__':
+    main()
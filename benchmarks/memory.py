@@ -0,0 +1,86 @@
+"""Measure the memory held by lexed tokens and by the parsed tree.
+
+usage: python benchmarks/memory.py [nfuncs]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from util.lexer import RegexLexer, TokenType
+from util.parser import Parser, AST
+
+
+FUNC = """func f%d(a int, b float) float {
+    var c int
+    c = a * %d + (a - 1) / 2
+    if c > 10 {
+        b = b + float(c)
+    }
+    return b * -1
+}
+
+"""
+
+
+def make_source(nfuncs):
+    return "package main\n\n" + "".join(FUNC % (i, i) for i in range(nfuncs)) + "\n"
+
+
+def fields(node):
+    if hasattr(node, "__dict__"):
+        return list(vars(node).values())
+    return [getattr(node, name, None) for cls in type(node).__mro__ for name in getattr(cls, "__slots__", ())]
+
+
+def count_nodes(tree):
+    count = 0
+    todo = [tree]
+    while todo:
+        item = todo.pop()
+        if isinstance(item, list):
+            todo.extend(item)
+        elif isinstance(item, AST):
+            count += 1
+            todo.extend(fields(item))
+    return count
+
+
+def measure(func):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = func()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return result, used
+
+
+def lex_all(source):
+    lexer = RegexLexer("bench", source)
+    tokens = []
+    while True:
+        token = lexer.getToken()
+        tokens.append(token)
+        if token.kind == TokenType.EOF:
+            return tokens
+
+
+def main():
+    nfuncs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    source = make_source(nfuncs)
+
+    tokens, used = measure(lambda: lex_all(source))
+    # the list holding the tokens is not part of their size
+    used -= sys.getsizeof(tokens)
+    print("tokens %9d %10d bytes %6.1f bytes/token" % (len(tokens), used, used / len(tokens)))
+    del tokens
+
+    tree, used = measure(lambda: Parser(RegexLexer("bench", source)).parse())
+    nodes = count_nodes(tree)
+    # includes the tokens and lists the nodes keep
+    print("nodes  %9d %10d bytes %6.1f bytes/node" % (nodes, used, used / nodes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+package main
+
+// chains of nested calls, kept shallow enough for the tree interpreter
+func depth(n int) int {
+	if n == 0 {
+		return 0
+	}
+	return 1 + depth(n - 1)
+}
+
+func main() int {
+	var i int
+	var s int
+	i = 0
+	s = 0
+	for i < 300 {
+		s = s + depth(50)
+		i = i + 1
+	}
+	return s
+}
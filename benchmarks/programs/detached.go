@@ -0,0 +1,26 @@
+package main
+
+// a goroutine that never returns, left behind when main does
+func spin(c chan int) {
+	var n int
+	n = 0
+	c <- 1
+	for n >= 0 {
+		n = n + 1
+	}
+}
+
+func main() int {
+	var c chan int
+	var i int
+	var s int
+	c = make(chan int)
+	go spin(c)
+	s = <-c
+	i = 0
+	for i < 20000 {
+		s = s + i
+		i = i + 1
+	}
+	return s
+}
@@ -0,0 +1,14 @@
+package main
+
+// integer division, truncated toward zero like Go
+func main() int {
+	var i int
+	var s int
+	i = 1
+	s = 0
+	for i < 50000 {
+		s = s + 1000000 / i - i / 7
+		i = i + 1
+	}
+	return s
+}
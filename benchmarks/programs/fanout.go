@@ -0,0 +1,45 @@
+package main
+
+// fan-out to workers on an unbuffered channel, fan-in of their sums
+func work(jobs chan int, results chan int) {
+	var s int
+	var v int
+	s = 0
+	v = <-jobs
+	for v >= 0 {
+		s = s + v * v
+		v = <-jobs
+	}
+	results <- s
+}
+
+func main() int {
+	var jobs chan int
+	var results chan int
+	var i int
+	var s int
+	jobs = make(chan int)
+	results = make(chan int)
+	i = 0
+	for i < 4 {
+		go work(jobs, results)
+		i = i + 1
+	}
+	i = 0
+	for i < 500 {
+		jobs <- i
+		i = i + 1
+	}
+	i = 0
+	for i < 4 {
+		jobs <- -1
+		i = i + 1
+	}
+	s = 0
+	i = 0
+	for i < 4 {
+		s = s + <-results
+		i = i + 1
+	}
+	return s
+}
@@ -0,0 +1,13 @@
+package main
+
+// recursive calls, the same shape as test.go
+func fib(n int) int {
+	if n < 2 {
+		return n
+	}
+	return fib(n-1) + fib(n-2)
+}
+
+func main() int {
+	return fib(20)
+}
@@ -0,0 +1,17 @@
+package main
+
+// float arithmetic, the Leibniz series for pi
+func main() float {
+	var i int
+	var s float
+	var sign float
+	i = 0
+	s = 0.0
+	sign = 1.0
+	for i < 20000 {
+		s = s + sign / float(2 * i + 1)
+		sign = -sign
+		i = i + 1
+	}
+	return s * 4.0
+}
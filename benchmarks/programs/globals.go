@@ -0,0 +1,21 @@
+package main
+
+// reads and writes of package level variables from a called function
+var total int
+var steps int
+
+func step(k int) int {
+	total = total + k
+	steps = steps + 1
+	return total
+}
+
+func main() int {
+	var i int
+	i = 0
+	for i < 20000 {
+		step(i)
+		i = i + 1
+	}
+	return total + steps
+}
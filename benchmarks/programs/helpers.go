@@ -0,0 +1,29 @@
+package main
+
+// small helper functions called from a hot loop
+func sq(x int) int {
+	return x * x
+}
+
+func clamp(x int, hi int) int {
+	if x > hi {
+		x = hi
+	}
+	return x
+}
+
+func mix(a int, b int) int {
+	return clamp(sq(a) + b, 1000000)
+}
+
+func main() int {
+	var i int
+	var s int
+	i = 0
+	s = 0
+	for i < 5000 {
+		s = s + mix(i, 3) - mix(3, i)
+		i = i + 1
+	}
+	return s
+}
@@ -0,0 +1,14 @@
+package main
+
+// a tight counting for loop over int locals
+func main() int {
+	var i int
+	var s int
+	i = 0
+	s = 0
+	for i < 50000 {
+		s = s + i * 3 - 1
+		i = i + 1
+	}
+	return s
+}
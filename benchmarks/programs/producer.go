@@ -0,0 +1,27 @@
+package main
+
+// one producer and one consumer on a buffered channel
+func produce(c chan int, n int) {
+	var i int
+	i = 0
+	for i < n {
+		c <- i
+		i = i + 1
+	}
+	c <- -1
+}
+
+func main() int {
+	var c chan int
+	var s int
+	var v int
+	c = make(chan int, 16)
+	go produce(c, 2000)
+	s = 0
+	v = <-c
+	for v >= 0 {
+		s = s + v
+		v = <-c
+	}
+	return s
+}
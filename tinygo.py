@@ -1,39 +1,217 @@
 import sys
+import json
+import argparse
 # sys.path.append("../")
 
 from util.lexer import *
 from util.parser import *
 from util.semantic_analyzer import *
 from util.interpreter import *
+from util.optimizer import *
+from util.compiler import *
+from util.vm import *
+from util.stack_interpreter import *
+from util.memo import MemoTable
+from util.cache import TreeCache
+from util.stats import PhaseTimer, TokenBuffer, CountingInterpreter, CountingStackInterpreter, Stats
+from util.profiler import ProfilingInterpreter
+from util.transpiler import Transpiler, PythonRunner
+from util.jit import JitInterpreter
+from util.parallel import ParallelInterpreter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage="python3 tinygo.py [options] filename.go")
+    parser.add_argument("filename")
+    parser.add_argument("--engine", choices=["vm", "tree", "stack", "python", "jit"], default="vm",
+                        help="execute on the bytecode vm (default), the tree-walking interpreter, "
+                             "the non-recursive tree interpreter, as generated Python code or on "
+                             "the tree-walking interpreter compiling hot code to Python")
+    parser.add_argument("--lexer", choices=["regex", "char"],
+                        help="lex with the regular expression lexer (default) or the character lexer")
+    parser.add_argument("--stream", action="store_true",
+                        help="read the source in chunks while parsing instead of all at once, "
+                             "with its own lexer")
+    parser.add_argument("-O", dest="optimize", action="store_true",
+                        help="optimize the analyzed tree and print per-pass statistics")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="neither load nor write the analyzed tree in __tinygocache__")
+    parser.add_argument("--stats", action="store_true",
+                        help="print time and net allocated blocks per phase and interpreter counters")
+    parser.add_argument("--stats-json", metavar="FILE",
+                        help="write the --stats report as JSON to FILE, - for stdout with all other "
+                             "output on stderr")
+    parser.add_argument("--profile", action="store_true",
+                        help="run on the tree interpreter and report time per TinyGo function and line")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="write the profile as collapsed stacks for flame graphs to FILE")
+    parser.add_argument("--emit-python", metavar="FILE",
+                        help="run as Python code and write the generated source to FILE, - for stdout")
+    parser.add_argument("--jit-threshold", type=int, default=100, metavar="N",
+                        help="calls or loop iterations before the jit engine compiles (default 100)")
+    parser.add_argument("--parallel", type=int, metavar="N",
+                        help="run on the tree interpreter and evaluate independent pure calls "
+                             "on N worker processes, 0 for one per core")
+    parser.add_argument("--fork-depth", type=int, metavar="D",
+                        help="nested forks before --parallel runs calls sequentially "
+                             "(default about 4 tasks per worker)")
+    parser.add_argument("--memo", action="store_true",
+                        help="cache the results of pure functions and print hit/miss counters")
+    parser.add_argument("--memo-size", type=int, default=1024, metavar="N",
+                        help="entries kept per function cache (default 1024)")
+    args = parser.parse_args()
+    if args.stream and args.lexer is not None:
+        parser.error("--stream has its own lexer and cannot be combined with --lexer")
+    return args
 
 
 def main():
-    if len(sys.argv)<2:
-        exit("Usage: python3 tinygo.py  filename.go")
-        
-    filename = sys.argv[1]
+    args = parse_args()
+    filename = args.filename
+    
+    args.stats = args.stats or args.stats_json is not None
+    args.profile = args.profile or args.profile_out is not None
+    if args.profile or args.parallel is not None:
+        # the profiler and the fork points hook into the tree-walking Interpreter
+        args.engine = "tree"
+    elif args.emit_python is not None:
+        args.engine = "python"
+    timer = PhaseTimer(blocks=args.stats)
+    report_out = sys.stdout
+    if args.stats_json == "-":
+        # keep stdout for the JSON report alone
+        sys.stdout = sys.stderr
+    
+    if args.cache:
+        timer.start("cache")
+    cache = TreeCache(filename, args.optimize) if args.cache else None
+    hit = cache is not None and cache.load()
+    
+    # the VM and the Python backend only need the code made from the tree
+    compiled = {"vm": "module", "python": "python"}.get(args.engine)
+    try:
+        module = cache.get(compiled) if hit and compiled else None
+        tree = None
+        if module is None:
+            tree = cache.get("tree") if hit else None
+            if tree is None:
+                tree = analyze(filename, args, timer)
+                # each engine caches only the form it runs from
+                if cache is not None and compiled is None:
+                    timer.start("cache")
+                    cache.store("tree", tree)
+            else:
+                print("[Phase 1] Loading cached tree...")
+        else:
+            print("[Phase 1] Loading cached %s..." % ("bytecode" if args.engine == "vm" else "Python code"))
+        print("[Phase 4] Interpreting...")        
+        memo = MemoTable(args.memo_size) if args.memo else None
+        if args.profile:
+            interpreter = ProfilingInterpreter(tree, memo)
+        elif args.parallel is not None:
+            interpreter = ParallelInterpreter(tree, memo, args.parallel, args.fork_depth)
+        elif args.engine == "tree":
+            interpreter = (CountingInterpreter if args.stats else Interpreter)(tree, memo)
+        elif args.engine == "jit":
+            interpreter = JitInterpreter(tree, memo, args.jit_threshold)
+        elif args.engine == "stack":
+            interpreter = (CountingStackInterpreter if args.stats else StackInterpreter)(tree, memo)
+        elif args.engine == "python":
+            if module is None:
+                timer.start("transpile")
+                module = Transpiler(tree, filename).transpile()
+                if cache is not None:
+                    timer.start("cache")
+                    cache.store("python", module)
+            if args.emit_python is not None:
+                write_output(args.emit_python, module.source)
+            interpreter = PythonRunner(module, memo)
+        else:
+            if module is None:
+                timer.start("compile")
+                module = Compiler(tree).compile()
+                if cache is not None:
+                    timer.start("cache")
+                    cache.store("module", module)
+            interpreter = VM(module, memo)
+        timer.start("interpret")
+        interpreter.interpret()
+        timer.stop()
+        if args.engine == "jit":
+            print("[JIT]")
+            print(interpreter.report())
+        if memo is not None:
+            print("[Memo]")
+            print(memo.report())
+    
+    except (LexerError,ParserError,SemanticError, InterpretError)as e:
+        print(e.message)
+        exit(1)
+    except RecursionError:
+        print("maximum recursion depth exceeded, try the vm or stack engine")
+        exit(1)
+    
+    if args.profile:
+        profiler = interpreter.profiler
+        with open(filename, "r") as f:
+            source_lines = f.read().split("\n")
+        print("[Profile]")
+        print(profiler.report(source_lines))
+        if args.profile_out is not None:
+            with open(args.profile_out, "w") as f:
+                f.write(profiler.collapsed_stacks() + "\n")
     
+    if args.stats:
+        stats = Stats(timer, interpreter, tree)
+        if args.stats_json != "-":
+            print("[Stats]")
+            print(stats.format())
+        if args.stats_json is not None:
+            write_output(args.stats_json, json.dumps(stats.to_dict(), indent=2) + "\n", report_out)
+    
+    print("Interpret completed.")
+
+
+def write_output(filename, text, out=None):
+    if filename == "-":
+        print(text, end="", file=out)
+    else:
+        with open(filename, "w") as f:
+            f.write(text)
+
+
+def analyze(filename, args, timer):
+    timer.start("lex")
     with open(filename, "r") as f:
-        input = "".join(f.readlines())+"\n"
+        if not args.stream:
+            input = "".join(f.readlines())+"\n"
         
-        try:
-            print("[Phase 1] Lexing...")
+        print("[Phase 1] Lexing...")
+        if args.stream:
+            lexer = StreamLexer(filename, f, suffix="\n")
+        elif args.lexer == "char":
             lexer = Lexer(filename, input)
-            print("[Phase 2] Parsing...")
-            parser = Parser(lexer)
-            tree = parser.parse()
-            print("[Phase 3] Semantic Checking...")        
-            s = SemanticAnalyzer()
-            s.analyze(tree)
-            print("[Phase 4] Interpreting...")        
-            interpreter = Interpreter(tree)
-            interpreter.interpret()
-        
-        except (LexerError,ParserError,SemanticError, InterpretError)as e:
-            print(e.message)
-            exit(1)
-        
-        print("Interpret completed.")
+        else:
+            lexer = RegexLexer(filename, input)
+        if args.stats:
+            # lex everything now, the lexers are lazy
+            lexer = TokenBuffer(lexer)
+        print("[Phase 2] Parsing...")
+        timer.start("parse")
+        parser = Parser(lexer)
+        tree = parser.parse()
+    print("[Phase 3] Semantic Checking...")        
+    timer.start("analyze")
+    s = SemanticAnalyzer()
+    s.analyze(tree)
+    if args.optimize:
+        print("[Phase 3] Optimizing...")
+        timer.start("optimize")
+        optimizer = Optimizer()
+        tree = optimizer.optimize(tree)
+        print(optimizer.report())
+    return tree
+
             
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,42 @@
+import sys
+import json
+import argparse
+
+from util.batch import collect, run_batch, format_report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage="python3 tinygo_batch.py [options] path ...")
+    parser.add_argument("paths", nargs="+", metavar="path",
+                        help=".go files, directories searched recursively or glob patterns")
+    parser.add_argument("--engine", choices=["vm", "tree", "stack", "python", "jit"], default="vm")
+    parser.add_argument("-O", dest="optimize", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int, default=None, metavar="N",
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--timeout", type=float, default=10.0, metavar="SECONDS",
+                        help="per-file CPU time limit, 0 for none (default 10)")
+    parser.add_argument("--report", metavar="FILE",
+                        help="write the JSON report to FILE, - for stdout")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    paths = collect(args.paths)
+    if not paths:
+        print("No .go files found", file=sys.stderr)
+        exit(2)
+    report = run_batch(paths, args.engine, args.optimize, args.timeout or None, args.jobs)
+    if args.report == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_report(report))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+    exit(1 if report["summary"]["failed"] else 0)
+
+
+if __name__ == '__main__':
+    main()
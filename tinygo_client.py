@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import socket
+import argparse
+
+# same as util.server.DEFAULT_SOCKET, not imported to keep startup short
+DEFAULT_SOCKET = os.path.join(os.environ.get("TMPDIR", "/tmp"), "tinygo-%d.sock" % os.getuid())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage="python3 tinygo_client.py [options] filename.go ...")
+    parser.add_argument("filenames", nargs="+", metavar="filename",
+                        help="programs to run, - reads the source from stdin")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, metavar="PATH",
+                        help="unix socket of tinygo_server.py (default %s)" % DEFAULT_SOCKET)
+    parser.add_argument("--engine", choices=["vm", "tree", "stack", "python", "jit"], default="vm")
+    parser.add_argument("-O", dest="optimize", action="store_true")
+    parser.add_argument("--memo", action="store_true")
+    parser.add_argument("--json", action="store_true",
+                        help="print the raw responses")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(args.socket)
+    except OSError as e:
+        print("Can't connect to %s: %s" % (args.socket, e.strerror), file=sys.stderr)
+        exit(2)
+
+    requests = []
+    for i, filename in enumerate(args.filenames):
+        request = {"id": i, "engine": args.engine, "optimize": args.optimize, "memo": args.memo}
+        if filename == "-":
+            request["source"] = sys.stdin.read()
+            request["filename"] = "<stdin>"
+        else:
+            # the server may run in another directory
+            request["path"] = os.path.abspath(filename)
+        requests.append(json.dumps(request) + "\n")
+    conn.sendall("".join(requests).encode())
+
+    failed = False
+    with conn, conn.makefile("r", encoding="utf-8") as responses:
+        for _ in requests:
+            line = responses.readline()
+            if not line:
+                print("Server closed the connection", file=sys.stderr)
+                exit(2)
+            response = json.loads(line)
+            if args.json:
+                print(line, end="")
+            elif response["ok"]:
+                print(response["result"])
+            else:
+                print(response["error"]["message"])
+            failed = failed or not response["ok"]
+    exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import sys
+import signal
+import argparse
+
+from util.server import Server, serve_stdio, serve_unix, DEFAULT_SOCKET
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage="python3 tinygo_server.py [--socket PATH | --stdio] [--cache-size N]")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, metavar="PATH",
+                        help="listen on this unix socket (default %s)" % DEFAULT_SOCKET)
+    parser.add_argument("--stdio", action="store_true",
+                        help="read requests from stdin and write responses to stdout instead")
+    parser.add_argument("--cache-size", type=int, default=128, metavar="N",
+                        help="programs kept ready to run (default 128)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = Server(args.cache_size)
+    if args.stdio:
+        serve_stdio(server)
+        return
+    print("Serving on %s" % args.socket, file=sys.stderr)
+    # exit through serve_unix's cleanup, which removes the socket file
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve_unix(server, args.socket)
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(e, file=sys.stderr)
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import io
+import os
+import glob
+import time
+import signal
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from util.lexer import RegexLexer
+from util.parser import Parser
+from util.semantic_analyzer import SemanticAnalyzer
+from util.optimizer import Optimizer
+from util.compiler import Compiler
+from util.transpiler import Transpiler
+from util.run import execute
+from util.stats import PhaseTimer, TokenBuffer
+from util.error import Error
+
+
+class Timeout(Exception):
+    pass
+
+
+def _alarm(signum, frame):
+    raise Timeout()
+
+
+def collect(patterns):
+    """Expand files, directories (searched for *.go recursively) and globs
+    into a sorted list of paths without duplicates."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(glob.glob(os.path.join(pattern, "**", "*.go"), recursive=True))
+        elif os.path.isfile(pattern):
+            paths.add(pattern)
+        else:
+            paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(paths)
+
+
+def run_file(path, engine="vm", optimize=False, timeout=None):
+    """Run one file through every phase in this process.
+
+    Returns a dict with the result or the error and the seconds spent in
+    each phase. The source is lexed completely before parsing, so "lex"
+    and "parse" are timed apart. `timeout` bounds the CPU seconds of the
+    whole file where the platform has interval timers; CPU rather than
+    wall time keeps a busy machine from timing out files that are only
+    waiting for a core.
+    """
+    report = {"path": path, "ok": False, "result": None, "error": None}
+    timer = PhaseTimer()
+    use_alarm = timeout and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGPROF, _alarm)
+        signal.setitimer(signal.ITIMER_PROF, timeout)
+    try:
+        # the interpreters may print, keep the report the only output
+        with contextlib.redirect_stdout(io.StringIO()):
+            timer.start("read")
+            with open(path, "r") as f:
+                source = f.read() + "\n"
+            timer.start("lex")
+            tokens = TokenBuffer(RegexLexer(path, source))
+            timer.start("parse")
+            tree = Parser(tokens).parse()
+            timer.start("analyze")
+            SemanticAnalyzer().analyze(tree)
+            if optimize:
+                timer.start("optimize")
+                tree = Optimizer().optimize(tree)
+            program = tree
+            if engine == "vm":
+                timer.start("compile")
+                program = Compiler(tree).compile()
+            elif engine == "python":
+                timer.start("transpile")
+                program = Transpiler(tree, path).transpile()
+            timer.start("run")
+            report["result"] = execute(program, engine)
+            report["ok"] = True
+    except Timeout:
+        report["error"] = error("Timeout", None, "exceeded %gs of CPU time in phase %s" % (timeout, timer.phase))
+    except Error as e:
+        report["error"] = error(type(e).__name__, e.error_code, e.message)
+    except RecursionError:
+        report["error"] = error("RecursionError", None, "maximum recursion depth exceeded")
+    except Exception as e:
+        report["error"] = error(type(e).__name__, None, str(e))
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+    timer.stop()
+    report["phases"] = timer.phases
+    report["seconds"] = sum(timer.phases.values())
+    return report
+
+
+def error(type, code, message):
+    return {"type": type, "code": code, "message": message}
+
+
+def run_batch(paths, engine="vm", optimize=False, timeout=None, jobs=None):
+    """Run every path in a process pool and return the report dict,
+    "files" in the order of `paths` plus a "summary"."""
+    start = time.perf_counter()
+    jobs = jobs or os.cpu_count() or 1
+    files = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_file, path, engine, optimize, timeout) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                files.append(future.result())
+            except Exception as e:
+                # the worker died, e.g. killed or out of memory
+                files.append({"path": path, "ok": False, "result": None,
+                              "error": error(type(e).__name__, None, str(e)), "phases": {}, "seconds": 0.0})
+
+    phases = {}
+    errors = {}
+    for report in files:
+        for phase, seconds in report["phases"].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        if not report["ok"]:
+            kind = report["error"]["type"]
+            errors[kind] = errors.get(kind, 0) + 1
+    summary = {
+        "files": len(files),
+        "ok": sum(1 for report in files if report["ok"]),
+        "failed": sum(1 for report in files if not report["ok"]),
+        "errors": errors,
+        "phases": phases,
+        "jobs": jobs,
+        "engine": engine,
+        "seconds": time.perf_counter() - start,
+    }
+    return {"summary": summary, "files": files}
+
+
+def format_report(report):
+    lines = []
+    for file in report["files"]:
+        if file["ok"]:
+            outcome = "ok     %s" % (file["result"],)
+        else:
+            outcome = "FAILED %s: %s" % (file["error"]["type"], file["error"]["message"])
+        lines.append("%9.3f ms  %s  %s" % (file["seconds"] * 1000, file["path"], outcome))
+    summary = report["summary"]
+    lines.append("%d files, %d ok, %d failed in %.3f s on %d workers" % (
+        summary["files"], summary["ok"], summary["failed"], summary["seconds"], summary["jobs"]))
+    for phase, seconds in summary["phases"].items():
+        lines.append("    %-10s %10.3f ms" % (phase, seconds * 1000))
+    for kind, count in sorted(summary["errors"].items()):
+        lines.append("    %-20s %6d" % (kind, count))
+    return "\n".join(lines)
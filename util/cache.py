@@ -0,0 +1,97 @@
+import os
+import sys
+import pickle
+import hashlib
+
+# bump when the layout of the cached objects changes without a source change
+CACHE_FORMAT = 1
+CACHE_DIR = "__tinygocache__"
+
+
+def interpreter_version():
+    """Fingerprint of the util package sources and of the running Python.
+
+    Any change to the lexer, parser, analyzer or compiler gives a new key, so
+    a stale tree is never loaded into a newer interpreter.
+    """
+    digest = hashlib.sha256()
+    digest.update(("%d %s" % (CACHE_FORMAT, sys.implementation.cache_tag)).encode())
+    util_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(util_dir)):
+        if name.endswith(".py"):
+            with open(os.path.join(util_dir, name), "rb") as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class TreeCache:
+    """On-disk cache of analyzed trees, next to the sources like __pycache__.
+
+    `<dir>/__tinygocache__/<file>.pickle` holds the key it was written for
+    and the pickled parts: the "tree" and, once the VM or the Python backend
+    has run it, the compiled "module" or the generated "python". Parts are
+    unpickled on demand, so the VM never pays for loading the tree. The key
+    hashes the source, the interpreter version and the options changing the
+    tree; any mismatch or unreadable entry is a miss.
+    """
+
+    def __init__(self, filename, optimize=False):
+        self.filename = filename
+        self.optimize = optimize
+        head, tail = os.path.split(os.path.abspath(filename))
+        self.path = os.path.join(head, CACHE_DIR, tail + (".opt" if optimize else "") + ".pickle")
+        self.key = None
+        self.parts = {}
+
+    def compute_key(self, stream, chunk_size=1 << 16):
+        # hashes the file in chunks so --stream keeps its memory bound
+        digest = hashlib.sha256()
+        digest.update(interpreter_version().encode())
+        digest.update(b"O" if self.optimize else b"-")
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+        self.key = digest.hexdigest()
+        return self.key
+
+    def load(self):
+        with open(self.filename, "rb") as f:
+            self.compute_key(f)
+        try:
+            with open(self.path, "rb") as f:
+                key, parts = pickle.load(f)
+        except Exception:
+            # missing, truncated or written by an incompatible version
+            return False
+        if key != self.key:
+            return False
+        self.parts = parts
+        return True
+
+    def get(self, name):
+        data = self.parts.get(name)
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def store(self, name, obj):
+        if self.key is None:
+            return
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            self.parts[name] = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                pickle.dump((self.key, self.parts), f, pickle.HIGHEST_PROTOCOL)
+            # readers see either the old entry or the whole new one
+            os.replace(tmp, self.path)
+        except (OSError, pickle.PicklingError, RecursionError):
+            # an unwritable directory or a too deep tree only costs the cache
+            if os.path.exists(tmp):
+                os.remove(tmp)
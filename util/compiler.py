@@ -0,0 +1,270 @@
+from util.parser import *
+from util.semantic_analyzer import NodeVisitor, ZERO_VALUES
+from util.error import InterpretError, ErrorCode
+
+# opcodes, every instruction is an (opcode, argument) pair in CodeObject.code
+LOAD_CONST = 1
+LOAD_LOCAL = 2
+STORE_LOCAL = 3
+LOAD_GLOBAL = 4
+STORE_GLOBAL = 5
+ADD = 10
+SUB = 11
+MUL = 12
+DIV = 13
+NEG = 14
+INT_DIV = 15
+TO_INT = 16
+TO_FLOAT = 17
+CMP_EQ = 20
+CMP_NE = 21
+CMP_GT = 22
+CMP_GE = 23
+CMP_LT = 24
+CMP_LE = 25
+JUMP = 30
+JUMP_IF_FALSE = 31
+CALL = 40
+RETURN = 41
+POP = 42
+TAIL_CALL = 43
+
+OPNAMES = {v: k for k, v in list(globals().items()) if k.isupper() and isinstance(v, int)}
+
+BINARY_OPS = {
+    TokenType.PLUS: ADD,
+    TokenType.MINUS: SUB,
+    TokenType.MULTI: MUL,
+    TokenType.DIVID: DIV,
+}
+
+# by the static type of the operands
+TYPED_OPS = {
+    "int": {**BINARY_OPS, TokenType.DIVID: INT_DIV},
+    "float": BINARY_OPS,
+}
+
+UNARY_OPS = {
+    TokenType.MINUS: NEG,
+    TokenType.INT: TO_INT,
+    TokenType.FLOAT: TO_FLOAT,
+}
+
+COMPARE_OPS = {
+    TokenType.EQEQ: CMP_EQ,
+    TokenType.NOTEQ: CMP_NE,
+    TokenType.GT: CMP_GT,
+    TokenType.GTEQ: CMP_GE,
+    TokenType.LT: CMP_LT,
+    TokenType.LTEQ: CMP_LE,
+}
+
+
+class CodeObject:
+    def __init__(self, name, nparams, level=2, varnames=None, pure=False):
+        self.name = name
+        self.nparams = nparams
+        self.level = level
+        self.pure = pure
+        self.code = []
+        self.consts = []
+        self.varnames = varnames or []
+        self._const_index = {}
+
+    @property
+    def nlocals(self):
+        return len(self.varnames)
+
+    def emit(self, op, arg=0):
+        self.code.append(op)
+        self.code.append(arg)
+        return len(self.code) - 2
+
+    def patch(self, pos, arg):
+        self.code[pos + 1] = arg
+
+    def here(self):
+        return len(self.code)
+
+    def add_const(self, value):
+        # 1 == 1.0 == True, so keep the type in the key
+        key = (type(value), value)
+        if key not in self._const_index:
+            self._const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self._const_index[key]
+
+    def __str__(self):
+        lines = ["code %s (params=%d, locals=%s)" % (self.name, self.nparams, self.varnames)]
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            extra = ""
+            if op == LOAD_CONST:
+                extra = "(%r)" % self.consts[arg]
+            elif op in (LOAD_LOCAL, STORE_LOCAL):
+                extra = "(%s)" % self.varnames[arg]
+            lines.append("%6d %-14s %d %s" % (pc, OPNAMES[op], arg, extra))
+        return "\n".join(lines)
+
+    __repr__ = __str__
+
+
+class Module:
+    def __init__(self, package):
+        self.package = package
+        self.functions = []
+        self.globals = []
+        self.global_values = []
+        self.main = None
+
+    def __str__(self):
+        return "\n\n".join(str(code) for code in self.functions)
+
+    __repr__ = __str__
+
+
+class Compiler(NodeVisitor):
+    """Lower an analyzed Program into a Module of flat bytecode functions."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.module = None
+        self.func_index = {}
+        self.code = None
+
+    def compile(self):
+        return self.visit(self.tree)
+
+    def abort(self, error_code, msg):
+        raise InterpretError(
+            error_code=error_code.value,
+            message=msg
+        )
+
+    def visit_Program(self, node):
+        self.module = Module(node.package)
+        self.visit(node.block)
+        self.module.main = self.func_index[node.main]
+        return self.module
+
+    def visit_Block(self, node):
+        for var in node.vardecls:
+            self.module.globals.append(var.ident)
+            self.module.global_values.append(ZERO_VALUES[var.typename])
+
+        # number every function first so calls may reference later ones
+        for func in node.functions:
+            func_sym = func.func_sym
+            self.func_index[func_sym] = len(self.module.functions)
+            self.module.functions.append(
+                CodeObject(func.name, func_sym.arity, func_sym.level, func_sym.varnames, func_sym.pure))
+        for func in node.functions:
+            self.visit(func)
+
+    def visit_FuncBlock(self, node):
+        if self.code is not None:
+            self.abort(ErrorCode.SYNTAX_ERROR, "Nested function %s is not supported" % node.name)
+
+        self.code = self.module.functions[self.func_index[node.func_sym]]
+        self.visit(node.statementlist)
+        self.code.emit(LOAD_CONST, self.code.add_const(None))
+        self.code.emit(RETURN)
+        self.code = None
+
+    def visit_VarDecl(self, node):
+        self.code.emit(LOAD_CONST, self.code.add_const(ZERO_VALUES[node.typename]))
+        self.store(node)
+
+    def load(self, node):
+        if node.depth == self.code.level:
+            self.code.emit(LOAD_LOCAL, node.slot)
+        elif node.depth == 1:
+            self.code.emit(LOAD_GLOBAL, node.slot)
+        else:
+            self.abort(ErrorCode.SYNTAX_ERROR, "Enclosing function variable is not supported")
+
+    def store(self, node):
+        if node.depth == self.code.level:
+            self.code.emit(STORE_LOCAL, node.slot)
+        elif node.depth == 1:
+            self.code.emit(STORE_GLOBAL, node.slot)
+        else:
+            self.abort(ErrorCode.SYNTAX_ERROR, "Enclosing function variable is not supported")
+
+    def visit_StatesList(self, node):
+        for state in node.states:
+            self.visit(state)
+            if isinstance(state, FuncCall):
+                # call statement, discard its result
+                self.code.emit(POP)
+
+    def visit_IfStatement(self, node):
+        self.visit(node.cond)
+        jump = self.code.emit(JUMP_IF_FALSE)
+        self.visit(node.states)
+        self.code.patch(jump, self.code.here())
+
+    def visit_ForStatement(self, node):
+        start = self.code.here()
+        self.visit(node.cond)
+        jump = self.code.emit(JUMP_IF_FALSE)
+        self.visit(node.states)
+        self.code.emit(JUMP, start)
+        self.code.patch(jump, self.code.here())
+
+    def visit_RetDecl(self, node):
+        if node.tailcall is not None:
+            # falls back to CALL at run time, hence the RETURN after it
+            self.call(node.tailcall, TAIL_CALL)
+        else:
+            self.visit(node.val)
+        self.code.emit(RETURN)
+
+    def visit_AssignOp(self, node):
+        self.visit(node.right)
+        self.store(node)
+
+    def visit_FuncCall(self, node):
+        self.call(node, CALL)
+
+    def call(self, node, op):
+        # the SemanticAnalyzer checked the arity, nested functions abort above
+        for arg in node.args:
+            self.visit(arg)
+        self.code.emit(op, self.func_index[node.func_sym])
+
+    def visit_ConditionOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.code.emit(COMPARE_OPS[node.op.kind])
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.code.emit(TYPED_OPS[node.type][node.op.kind])
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.right)
+        if isinstance(node.op, Token) and node.op.kind in UNARY_OPS:
+            self.code.emit(UNARY_OPS[node.op.kind])
+
+    def visit_Ident(self, node):
+        self.load(node)
+
+    def visit_Num(self, node):
+        self.code.emit(LOAD_CONST, self.code.add_const(node.value))
+
+    def visit_LabelDecl(self, node):
+        pass
+
+    def visit_GotoDecl(self, node):
+        pass
+
+    def visit_GoStatement(self, node):
+        self.unsupported(node)
+
+    visit_SendStatement = visit_RecvOp = visit_MakeChan = visit_GoStatement
+
+    def unsupported(self, node):
+        self.abort(ErrorCode.SYNTAX_ERROR, "Goroutines and channels are not supported at line %d, "
+                   "run with --engine stack, tree or jit" % node.line)
@@ -7,6 +7,10 @@ class ErrorCode(Enum):
     DUPLICATE_ID = "Duplicate identifier found"
     SYNTAX_ERROR = "Syntax error"
     MISMATCH_ERROR = "Mismatching parameter"
+    TYPE_ERROR = "Mismatching type"
+    DEADLOCK = "Deadlock"
+    RANGE_ERROR = "Value out of range"
+    DIVIDE_BY_ZERO = "Division by zero"
     
 class Error(Exception):
     def __init__(self, error_code=None,  message=None):
@@ -27,4 +31,13 @@ class SemanticError(Error):
     pass
 
 class InterpretError(Error):
-    pass
\ No newline at end of file
+    pass
+
+
+def divide_error():
+    # a ZeroDivisionError of the running program, only integer division
+    # raises one, reported as Go's panic
+    return InterpretError(
+        error_code=ErrorCode.DIVIDE_BY_ZERO.value,
+        message="panic: runtime error: integer divide by zero"
+    )
\ No newline at end of file
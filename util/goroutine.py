@@ -0,0 +1,239 @@
+import threading
+from collections import deque
+
+from util.error import InterpretError, ErrorCode, divide_error
+
+# Channel.receive of a goroutine that has to wait
+BLOCKED = object()
+
+DEADLOCK = "fatal error: all goroutines are asleep - deadlock!"
+
+# loop iterations a goroutine of the StackInterpreter runs while others
+# are ready before it has to let them run
+SLICE = 1000
+
+
+def deadlock():
+    return InterpretError(error_code=ErrorCode.DEADLOCK.value, message=DEADLOCK)
+
+
+def make_channel_error(size):
+    return InterpretError(error_code=ErrorCode.RANGE_ERROR.value,
+                          message="panic: makechan: size out of range (%d)" % size)
+
+
+class Goroutine:
+    """A goroutine of the StackInterpreter, its own CallStack of Frames."""
+
+    def __init__(self, callstack):
+        self.callstack = callstack
+
+    def deliver(self, value):
+        # the result of the receive it is parked on
+        self.callstack.peek().values.append(value)
+
+
+class Scheduler:
+    """Run queue of the cooperative scheduler.
+
+    A goroutine runs until it finishes, waits on a channel or used up its
+    SLICE of loop iterations; a channel operation that completes the wait
+    of another goroutine makes that one ready again, at the back of the
+    queue.
+    """
+
+    def __init__(self):
+        self.ready = deque()
+        self.budget = SLICE
+
+    def wake(self, goroutine):
+        self.ready.append(goroutine)
+
+    def preempt(self, goroutine):
+        """Count a loop iteration while others are ready, return True when
+        the slice is used up and the goroutine is queued again."""
+        self.budget -= 1
+        if self.budget:
+            return False
+        self.budget = SLICE
+        self.ready.append(goroutine)
+        return True
+
+
+class Channel:
+    """Channel of the cooperative scheduler.
+
+    Values are handed over directly to a waiting receiver, else kept in
+    the buffer of `capacity` values, else the sender waits. Capacity 0
+    is an unbuffered channel, every send waits for its receiver.
+    """
+
+    def __init__(self, capacity, scheduler):
+        self.capacity = capacity
+        self.scheduler = scheduler
+        self.buffer = deque()
+        # goroutines waiting to receive, and (goroutine, value) waiting to send
+        self.receivers = deque()
+        self.senders = deque()
+
+    def send(self, goroutine, value):
+        """Return whether the send completed, else the goroutine waits."""
+        if self.receivers:
+            receiver = self.receivers.popleft()
+            receiver.deliver(value)
+            self.scheduler.wake(receiver)
+            return True
+        if len(self.buffer) < self.capacity:
+            self.buffer.append(value)
+            return True
+        self.senders.append((goroutine, value))
+        return False
+
+    def receive(self, goroutine):
+        """Return the value received, or BLOCKED when the goroutine waits
+        for a sender to deliver it."""
+        if self.buffer:
+            value = self.buffer.popleft()
+            if self.senders:
+                # the first waiting sender takes the freed place
+                sender, pending = self.senders.popleft()
+                self.buffer.append(pending)
+                self.scheduler.wake(sender)
+            return value
+        if self.senders:
+            sender, value = self.senders.popleft()
+            self.scheduler.wake(sender)
+            return value
+        self.receivers.append(goroutine)
+        return BLOCKED
+
+
+class GoExit(Exception):
+    """Raised in a goroutine thread when main returned or a goroutine failed."""
+
+
+class ThreadRuntime:
+    """Shared state of goroutines running on threads.
+
+    All channels wait on one Condition, so the runtime knows how many
+    goroutines wait with no wake-up pending: when that is all of the live
+    ones, no send or receive can ever complete and every waiter raises the
+    deadlock error. The first error of a goroutine thread is raised in
+    main, as Go takes the whole program down: at once when main waits on
+    a channel, else when it returns.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # goroutines running, main included, and those waiting
+        self.live = 1
+        self.waiting = 0
+        self.deadlocked = False
+        self.stopped = False
+        self.error = None
+        self.threads = []
+
+    def go(self, target, *args):
+        with self.condition:
+            self.live += 1
+        thread = threading.Thread(target=self.run, args=(target, args), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def run(self, target, args):
+        try:
+            target(*args)
+        except GoExit:
+            pass
+        except BaseException as e:
+            if isinstance(e, ZeroDivisionError):
+                e = divide_error()
+            with self.condition:
+                if self.error is None:
+                    self.error = e
+                self.notify()
+        finally:
+            with self.condition:
+                self.live -= 1
+                self.check()
+
+    def wait(self):
+        # with the condition held, until some channel operation notifies
+        if self.error is not None or self.stopped:
+            raise GoExit()
+        self.waiting += 1
+        self.check()
+        if self.deadlocked:
+            raise deadlock()
+        self.condition.wait()
+        if self.deadlocked:
+            raise deadlock()
+        if self.error is not None or self.stopped:
+            raise GoExit()
+
+    def poll(self):
+        # a running goroutine's check, without taking the condition
+        if self.stopped or self.error is not None:
+            raise GoExit()
+
+    def notify(self):
+        # every waiter wakes up and checks its channel again
+        self.waiting = 0
+        self.condition.notify_all()
+
+    def check(self):
+        if self.live and self.waiting == self.live and not self.deadlocked:
+            self.deadlocked = True
+            self.condition.notify_all()
+
+    def finish(self):
+        """Called by main once it returned, stopping the other goroutines."""
+        with self.condition:
+            self.stopped = True
+            self.notify()
+        # each leaves at its next call, loop iteration or channel wait
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class ThreadChannel:
+    """Channel of goroutines running on threads, see ThreadRuntime.
+
+    A send on an unbuffered channel queues its value, then waits until a
+    receiver took it.
+    """
+
+    def __init__(self, capacity, runtime):
+        self.capacity = capacity
+        self.runtime = runtime
+        self.buffer = deque()
+        # values queued and taken so far, numbering the unbuffered sends
+        self.sent = 0
+        self.received = 0
+
+    def send(self, value):
+        runtime = self.runtime
+        with runtime.condition:
+            if self.capacity:
+                while len(self.buffer) >= self.capacity:
+                    runtime.wait()
+                self.buffer.append(value)
+                runtime.notify()
+                return
+            self.sent += 1
+            ticket = self.sent
+            self.buffer.append(value)
+            runtime.notify()
+            while self.received < ticket:
+                runtime.wait()
+
+    def receive(self):
+        runtime = self.runtime
+        with runtime.condition:
+            while not self.buffer:
+                runtime.wait()
+            self.received += 1
+            runtime.notify()
+            return self.buffer.popleft()
@@ -1,26 +1,39 @@
 from util.parser import *
 from util.semantic_analyzer import *
 from util.error import *
+from util.memo import MISSING
+from util.goroutine import ThreadRuntime, ThreadChannel, GoExit, make_channel_error
 
 class ARType(Enum):
     PROGRAM = "Program"
     FUNCTION = "Function"
             
 class ActivationRecord:
-    def __init__(self, name, type, nested_level):
+    def __init__(self, name, type, nested_level, size=0, enclosing=None, varnames=None, slots=None):
         self.name = name
         self.type = type
         self.nested_level = nested_level
-        self.members = {}
+        # variables live in slots numbered by the semantic analyzer
+        self.slots = [None] * size if slots is None else slots
+        # record of the lexically enclosing scope
+        self.enclosing = enclosing
+        self.varnames = varnames
         
     def __setitem__(self, k, v):
-        self.members[k] = v 
+        self.slots[k] = v 
     
     def __getitem__(self, k):
-        return self.members[k] 
+        return self.slots[k] 
     
     def get(self, key):
-        return self.members.get(key)
+        if key < len(self.slots):
+            return self.slots[key]
+    
+    def lookup(self, depth):
+        ar = self
+        while ar.nested_level != depth:
+            ar = ar.enclosing
+        return ar
         
     def __str__(self):
         lines = [
@@ -30,7 +43,8 @@ class ActivationRecord:
                 name = self.name,
             )
         ]
-        for name, val in self.members.items():
+        for slot, val in enumerate(self.slots):
+            name = self.varnames[slot] if self.varnames else slot
             lines.append(f'  {name}: {val}')
 
         return "\n".join(lines)
@@ -51,6 +65,9 @@ class CallStack:
     def peek(self):
         return self._records[-1]
 
+    def __len__(self):
+        return len(self._records)
+
     def __str__(self):
         s = '\n'.join(repr(ar) for ar in reversed(self._records))
         s = f'CALL STACK\n===============\n{s}\n'
@@ -61,14 +78,31 @@ class CallStack:
     
     
      
+class TailCall:
+    """Returned by "return f(...)" so the caller runs f without nesting."""
+    def __init__(self, func_sym, args, enclosing):
+        self.func_sym = func_sym
+        self.args = args
+        self.enclosing = enclosing
+        
+     
 class Interpreter(NodeVisitor):
-    def __init__(self, tree):
+    def __init__(self, tree, memo=None):
         self.tree = tree
-        self.cur_level = 0
         self.callstack = CallStack()
+        # MemoTable caching the results of pure functions, or None
+        self.memo = memo
+        # ThreadRuntime once the program starts a goroutine or makes a channel
+        self.runtime = None
         
     def interpret(self):
-        self.visit(self.tree)
+        print(self.run())
+
+    def run(self):
+        try:
+            return self.visit(self.tree)
+        except ZeroDivisionError:
+            raise divide_error() from None
     
     def log(self, msg):
         print(msg)
@@ -81,85 +115,99 @@ class Interpreter(NodeVisitor):
         )
         
     def visit_Program(self, node):
-        self.cur_level += 1
-        
         ar = ActivationRecord(
             name = node.package,
             type = ARType.PROGRAM,
-            nested_level = self.cur_level
+            nested_level = 1,
+            size = node.nslots,
         )
         self.callstack.push(ar)
         
         self.visit(node.block)
+        try:
+            ret = self.call(node.main, [], ar)
+        except GoExit:
+            # a goroutine failed, finish raises its error
+            ret = None
+        finally:
+            if self.runtime is not None:
+                self.runtime.finish()
         
         # print(self.callstack)
         self.callstack.pop()
+        return ret
         
     
     def visit_Block(self, node):
-        global_func = {}
         for var in node.vardecls:
             self.visit(var)
-        for func in node.functions:
-            global_func[func.name] = func
-        
-        main = FuncCall("main")
-        main.func_sym = global_func["main"]
-        print(self.visit(main))
-        # self.visit_FuncCall(global_func["main"])
         
     
     def visit_VarDecl(self, node):
-        name = node.ident            
+        ar = self.callstack.peek()
+        ar.slots[node.slot] = ZERO_VALUES[node.typename]
     
-    # def visit_FuncBlock(self, node):     
-    #     # # func block
-    #     print("Enter Function %s" % node.name)
-            
-    #     self.visit(node.statementlist)
-        
-    #     print("Exit Function %s" % node.name)
-   
+    def visit_FuncBlock(self, node):
+        # nested declaration, the body runs through its FuncSymbol
+        pass
         
 
     def visit_FuncCall(self, node):
-        func_name = node.name
-        
-        self.cur_level += 1
-        ar = ActivationRecord(
-            name = func_name,
-            type = ARType.FUNCTION,
-            nested_level = self.cur_level,
-        )
-        
+        # resolved and arity checked by the SemanticAnalyzer
         func_sym = node.func_sym
-        
-        if func_sym==None:
-            self.abort(ErrorCode.ID_NOT_FOUND, "Function %s can't found"%func_name)
-            
-        formal_params = func_sym.params 
-        actual_params = node.args
+        args = [self.visit(arg) for arg in node.args]
+        enclosing = self.callstack.peek().lookup(func_sym.level - 1)
+        return self.call(func_sym, args, enclosing)
     
-        if formal_params!= [] and actual_params!=[]:
-            for param_sym, arg in zip(formal_params, actual_params):
-                ar[param_sym.ident] = self.visit(arg)
-                
-        self.callstack.push(ar) 
-        
-        ret = self.visit(func_sym.statementlist)
-        
-        # self.log(self.callstack)
-        self.callstack.pop()
+    def call(self, func_sym, args, enclosing):
+        # memo entries waiting for the result of a chain of tail calls
+        pending = []
+        while True:
+            if self.memo is not None and func_sym.pure:
+                cache = self.memo.cache(func_sym, func_sym.name)
+                key = tuple(args)
+                ret = cache.get(key)
+                if ret is not MISSING:
+                    break
+                pending.append((cache, key))
+            
+            ar = ActivationRecord(
+                name = func_sym.name,
+                type = ARType.FUNCTION,
+                nested_level = func_sym.level,
+                enclosing = enclosing,
+                varnames = func_sym.varnames,
+                slots = args + [None] * func_sym.nlocals,
+            )
+                    
+            self.callstack.push(ar)
+
+            ret = self.run_body(func_sym, ar)
+            
+            # self.log(self.callstack)
+            self.callstack.pop()
+            
+            if type(ret) is not TailCall:
+                break
+            # "return g(...)": run g in place of the finished record
+            func_sym, args, enclosing = ret.func_sym, ret.args, ret.enclosing
         
+        for cache, key in pending:
+            cache.set(key, ret)
         return ret
         # if func_sym.rettypes != None and len(func_sym.rettypes) != 0:
         #     return ret
-        
+
+    def run_body(self, func_sym, ar):
+        # ar is on top of the CallStack
+        return self.visit(func_sym.statementlist)
+
               
     def visit_StatesList(self, node):
         for state in node.states:
             last = self.visit(state)
-            if last != None:
+            # a call or receive statement's value is not a return
+            if last != None and type(state) not in EXPR_STATEMENTS:
                 return last
             
         
@@ -176,56 +224,42 @@ class Interpreter(NodeVisitor):
                 return last
         
     def visit_ConditionOp(self, node):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        if node.op.text == "==":
-            return left == right 
-        elif node.op.text == "!=":
-            return left != right 
-        elif node.op.text == ">":
-            return left > right 
-        elif node.op.text == ">=":
-            return left >= right 
-        elif node.op.text == "<":
-            return left < right 
-        elif node.op.text == "<=":
-            return left <= right 
+        return node.opfunc(self.visit(node.left), self.visit(node.right))
         
     def visit_RetDecl(self, node): 
+        call = node.tailcall
+        if call is not None:
+            # leave the call to the trampoline in Interpreter.call
+            func_sym = call.func_sym
+            args = [self.visit(arg) for arg in call.args]
+            enclosing = self.callstack.peek().lookup(func_sym.level - 1)
+            return TailCall(func_sym, args, enclosing)
         return self.visit(node.val)
         
     
     def visit_AssignOp(self, node):
-        name = node.left
         value = self.visit(node.right)
         
         ar = self.callstack.peek()
-        ar[name] = value
+        if ar.nested_level != node.depth:
+            ar = ar.lookup(node.depth)
+        ar.slots[node.slot] = value
         # self.log("%s = %s" % (name, value))
         
     def visit_UnaryOp(self, node):
-        if node.op.name != "PLUS":
-            return (-1)*self.visit(node.right)
-        return self.visit(node.right)
+        if node.opfunc is None:
+            return self.visit(node.right)
+        return node.opfunc(self.visit(node.right))
     
     def visit_BinOp(self, node):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        if node.op.text == "*":
-            return left  *   right 
-        elif node.op.text == "/":
-            return left  /  right 
-        elif node.op.text == "+":
-            return left  +  right 
-        elif node.op.text == "-":
-            return left  -  right 
+        return node.opfunc(self.visit(node.left), self.visit(node.right))
             
             
     def visit_Ident(self, node):
-        name = node.text
         ar = self.callstack.peek()
-        value = ar.get(name)
-        return value
+        if ar.nested_level != node.depth:
+            ar = ar.lookup(node.depth)
+        return ar.slots[node.slot]
         
     def visit_Num(self, node):
         return node.value
@@ -237,4 +271,68 @@ class Interpreter(NodeVisitor):
     def visit_GotoDecl(self, node):
         pass
     
+    # goroutines run on threads, each walking the tree with its own
+    # CallStack and no MemoTable, see ThreadRuntime
+    
+    def threads(self):
+        if self.runtime is None:
+            self.runtime = ThreadRuntime()
+        return self.runtime
+    
+    def visit_GoStatement(self, node):
+        call = node.call
+        func_sym = call.func_sym
+        args = [self.visit(arg) for arg in call.args]
+        enclosing = self.callstack.peek().lookup(func_sym.level - 1)
+        goroutine = GoroutineInterpreter(self.tree)
+        goroutine.runtime = self.threads()
+        goroutine.runtime.go(goroutine.call, func_sym, args, enclosing)
+    
+    def visit_SendStatement(self, node):
+        chan = self.visit(node.chan)
+        value = self.visit(node.value)
+        if chan is None:
+            self.block()
+        chan.send(value)
+    
+    def visit_RecvOp(self, node):
+        chan = self.visit(node.chan)
+        if chan is None:
+            self.block()
+        return chan.receive()
+    
+    def visit_MakeChan(self, node):
+        size = 0 if node.size is None else self.visit(node.size)
+        if size < 0:
+            raise make_channel_error(size)
+        return ThreadChannel(size, self.threads())
+    
+    def block(self):
+        # operations on a nil channel wait forever
+        runtime = self.threads()
+        with runtime.condition:
+            while True:
+                runtime.wait()
+
+
+class GoroutineInterpreter(Interpreter):
+    """Interpreter of a goroutine thread.
+
+    Threads can't be killed, so the goroutine leaves with GoExit at its
+    next call or loop iteration once main returned or another goroutine
+    failed.
+    """
+
+    def run_body(self, func_sym, ar):
+        self.runtime.poll()
+        return self.visit(func_sym.statementlist)
+
+    def visit_ForStatement(self, node):
+        runtime = self.runtime
+        while self.visit(node.cond):
+            runtime.poll()
+            last = self.visit(node.states)
+            if last != None:
+                return last
+    
      
\ No newline at end of file
@@ -0,0 +1,298 @@
+from util.parser import *
+from util.interpreter import Interpreter, TailCall
+from util.transpiler import Transpiler, recursion_limit, RECURSION_LIMIT
+from util.semantic_analyzer import ZERO_VALUES
+from util.stats import loop_names
+from util.error import InterpretError
+
+# returned by compiled code whose type guards failed, before it changed anything
+DEOPT = object()
+
+
+def walk(node):
+    """Every node of a statement list or expression, not descending into
+    nested FuncBlocks."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        kind = type(node)
+        if kind is StatesList:
+            stack.extend(node.states)
+        elif kind is IfStatement or kind is ForStatement:
+            stack.append(node.states)
+            stack.append(node.cond)
+        elif kind is AssignOp or kind is UnaryOp:
+            stack.append(node.right)
+        elif kind is RetDecl:
+            stack.append(node.val)
+        elif kind is FuncCall:
+            stack.extend(node.args)
+        elif kind is BinOp or kind is ConditionOp:
+            stack.append(node.right)
+            stack.append(node.left)
+        elif kind is GoStatement:
+            stack.append(node.call)
+        elif kind is SendStatement:
+            stack.append(node.value)
+            stack.append(node.chan)
+        elif kind is RecvOp:
+            stack.append(node.chan)
+        elif kind is MakeChan and node.size is not None:
+            stack.append(node.size)
+
+
+class JitCompiler(Transpiler):
+    """Compile one hot function body or for loop into a Python function
+    taking the ActivationRecord it runs in.
+
+    Variables nothing else can touch while the code runs become Python
+    locals, loaded at entry and stored back at exit: all of them when the
+    code calls no function, else those of its own frame unless a nested
+    function may see them. The others are read and written in their
+    record's slots. Expressions are generated by the Transpiler, so they
+    are specialized on the static types; the code returns DEOPT when a
+    variable it reads at entry doesn't hold its static type.
+    """
+
+    def __init__(self, name, level, nested):
+        super().__init__(None, name)
+        # nested level of the record the code runs in
+        self.level = level
+        # whether the function owning the code declares nested functions
+        self.nested = nested
+        self.localized = {}
+        self.funcs = {}
+
+    def compile_function(self, func_sym):
+        return self.compile(func_sym.statementlist, outlives=False)
+
+    def compile_loop(self, node):
+        return self.compile(node, outlives=True)
+
+    def compile(self, code, outlives):
+        nodes = list(walk(code))
+        calls = any(type(node) is FuncCall for node in nodes)
+        level = self.level
+        localize = lambda depth: not calls or depth == level and not self.nested
+
+        reads, writes, declared = {}, {}, set()
+        depths = set()
+        for node in nodes:
+            kind = type(node)
+            if kind is Ident:
+                reads[(node.depth, node.slot)] = node
+            elif kind is AssignOp:
+                writes[(node.depth, node.slot)] = node.left
+            elif kind is VarDecl:
+                writes[(node.depth, node.slot)] = node.ident
+                declared.add((node.depth, node.slot))
+            elif kind is FuncCall:
+                depths.add(node.func_sym.level - 1)
+        for depth, slot in list(reads) + list(writes):
+            if localize(depth):
+                name = reads[(depth, slot)].text if (depth, slot) in reads else writes[(depth, slot)]
+                self.localized[(depth, slot)] = "%s_%d_%d" % (name, depth, slot)
+            depths.add(depth)
+
+        self.emit("def jit(a%d):" % level)
+        self.indent += 1
+        for depth in sorted(depths):
+            if depth != level:
+                self.emit("a%d = a%d.lookup(%d)" % (depth, level, depth))
+            self.emit("s%d = a%d.slots" % (depth, depth))
+        for (depth, slot), pyname in sorted(self.localized.items()):
+            self.emit("%s = s%d[%d]" % (pyname, depth, slot))
+        guards = []
+        for key, node in sorted(reads.items()):
+            if key in self.localized and key not in declared and node.type in ("int", "float"):
+                guards.append("type(%s) is not %s" % (self.localized[key], node.type))
+        if guards:
+            self.emit("if %s:" % " or ".join(guards))
+            self.emit("    return DEOPT")
+
+        # the frame of a function dies with it, a loop's variables live on
+        stores = ["s%d[%d] = %s" % (depth, slot, self.localized[(depth, slot)])
+                  for depth, slot in sorted(writes) if (depth, slot) in self.localized and (outlives or depth != level)]
+        if stores:
+            self.emit("try:")
+            self.indent += 1
+        start = len(self.lines)
+        self.visit(code)
+        if len(self.lines) == start:
+            self.emit("pass")
+        if stores:
+            self.indent -= 1
+            self.emit("finally:")
+            for store in stores:
+                self.emit("    " + store)
+
+        namespace = {"DEOPT": DEOPT, "TailCall": TailCall, "int_div": int_div, "float_div": float_div}
+        namespace.update(self.funcs)
+        return "\n".join(self.lines) + "\n", namespace
+
+    def variable(self, depth, slot):
+        pyname = self.localized.get((depth, slot))
+        return "s%d[%d]" % (depth, slot) if pyname is None else pyname
+
+    def visit_FuncBlock(self, node):
+        # nested declaration, called through its FuncSymbol
+        pass
+
+    def visit_VarDecl(self, node):
+        self.emit("%s = %r" % (self.variable(node.depth, node.slot), ZERO_VALUES[node.typename]))
+
+    def visit_AssignOp(self, node):
+        self.emit("%s = %s" % (self.variable(node.depth, node.slot), self.visit(node.right)))
+
+    def visit_RetDecl(self, node):
+        call = node.tailcall
+        if call is not None:
+            # the trampoline in Interpreter.call runs it
+            self.emit("return TailCall(%s)" % self.call_args(call))
+            return
+        self.emit("return %s" % self.visit(node.val))
+
+    def visit_FuncCall(self, node):
+        return "call(%s)" % self.call_args(node)
+
+    def call_args(self, node):
+        func_sym = node.func_sym
+        name = "f_%s" % func_sym.name
+        if self.funcs.get(name, func_sym) is not func_sym:
+            # nested functions of the same name in different scopes
+            name = "f_%s_%d" % (func_sym.name, len(self.funcs))
+        self.funcs[name] = func_sym
+        return "%s, [%s], a%d" % (name, ", ".join(self.visit(arg) for arg in node.args), func_sym.level - 1)
+
+    def visit_Ident(self, node):
+        return self.variable(node.depth, node.slot)
+
+
+def owners(tree):
+    """Map every ForStatement to the FuncBlock it runs in."""
+    found = {}
+    functions = list(tree.block.functions)
+    while functions:
+        func = functions.pop()
+        for node in walk(func.statementlist):
+            if type(node) is ForStatement:
+                found[node] = func
+            elif type(node) is FuncBlock:
+                functions.append(node)
+    return found
+
+
+class JitInterpreter(Interpreter):
+    """Interpreter compiling hot code to Python.
+
+    Every function counts its calls and every for loop its iterations.
+    At `threshold` the JitCompiler turns the function body or the loop
+    into a Python function that runs in place of the tree from then on; a
+    loop switches in the middle, its state is all in the slots. Code
+    whose type guards fail, or that can't be compiled, stays on the tree.
+    Cold code never pays for compiling.
+    """
+
+    def __init__(self, tree, memo=None, threshold=100):
+        super().__init__(tree, memo)
+        self.threshold = threshold
+        # FuncSymbol or ForStatement -> calls or iterations so far
+        self.counts = {}
+        # FuncSymbol or ForStatement -> Python function, None for the tree
+        self.code = {}
+        self.owners = None
+        self.loop_names = None
+        # (name, outcome, calls or iterations) of every compile and guard failure
+        self.events = []
+
+    def run(self):
+        with recursion_limit(RECURSION_LIMIT):
+            return super().run()
+
+    def run_body(self, func_sym, ar):
+        code = self.code.get(func_sym)
+        if code is not None:
+            ret = code(ar)
+            if ret is not DEOPT:
+                return ret
+            self.deoptimize(func_sym)
+        elif func_sym not in self.code:
+            count = self.counts.get(func_sym, 0) + 1
+            self.counts[func_sym] = count
+            if count >= self.threshold:
+                code = self.compile(func_sym, func_sym.level, func_sym.statementlist)
+                if code is not None:
+                    ret = code(ar)
+                    if ret is not DEOPT:
+                        return ret
+                    self.deoptimize(func_sym)
+        return self.visit(func_sym.statementlist)
+
+    def visit_ForStatement(self, node):
+        code = self.code.get(node)
+        if code is not None:
+            ret = code(self.callstack.peek())
+            if ret is not DEOPT:
+                return ret
+            self.deoptimize(node)
+        count = self.counts.get(node, 0)
+        try:
+            while self.visit(node.cond):
+                last = self.visit(node.states)
+                if last != None:
+                    return last
+                count += 1
+                if count == self.threshold and node not in self.code:
+                    if self.owners is None:
+                        self.owners = owners(self.tree)
+                    func = self.owners[node]
+                    self.counts[node] = count
+                    code = self.compile(node, func.func_sym.level, func.statementlist)
+                    if code is not None:
+                        # the loop state is all in the slots, go on from here
+                        ret = code(self.callstack.peek())
+                        if ret is not DEOPT:
+                            return ret
+                        self.deoptimize(node)
+        finally:
+            self.counts[node] = count
+
+    def compile(self, key, level, body):
+        name = self.name(key)
+        nested = any(type(node) is FuncBlock for node in walk(body))
+        compiler = JitCompiler(name, level, nested)
+        try:
+            if isinstance(key, ForStatement):
+                source, namespace = compiler.compile_loop(key)
+            else:
+                source, namespace = compiler.compile_function(key)
+            namespace["call"] = self.call
+            exec(compile(source, "<jit %s>" % name, "exec"), namespace)
+        except (SyntaxError, RecursionError, InterpretError):
+            # e.g. an expression nested too deeply for the Python compiler,
+            # or channel operations
+            self.code[key] = None
+            self.events.append((name, "not compiled", self.counts[key]))
+            return None
+        code = self.code[key] = namespace["jit"]
+        self.events.append((name, "compiled", self.counts[key]))
+        return code
+
+    def deoptimize(self, key):
+        self.code[key] = None
+        self.events.append((self.name(key), "guard failed", self.counts[key]))
+
+    def name(self, key):
+        if isinstance(key, ForStatement):
+            if self.loop_names is None:
+                self.loop_names = loop_names(self.tree)
+            return self.loop_names[key]
+        return key.name
+
+    def report(self):
+        """One line per compile and guard failure, with the calls or loop
+        iterations counted before it."""
+        if not self.events:
+            return "    nothing compiled"
+        return "\n".join("    %-20s %-14s after %d" % event for event in self.events)
@@ -103,6 +103,10 @@ class Lexer:
                 prev = self.curChar
                 self.nextChar()
                 token = Token(prev+self.curChar, TokenType.LTEQ,self.curLine, self.curCol)
+            elif self.peek() == "-":
+                prev = self.curChar
+                self.nextChar()
+                token = Token(prev+self.curChar, TokenType.ARROW,self.curLine, self.curCol)
             else:
                 token = Token(self.curChar, TokenType.LT,self.curLine, self.curCol)
         
@@ -153,6 +157,8 @@ class Lexer:
     
 
 class Token:
+    __slots__ = ("text", "kind", "line", "col")
+
     def __init__(self, tokenText, tokenKind, line=None, col=None):
         self.text = tokenText
         self.kind = tokenKind
@@ -172,10 +178,7 @@ class Token:
 
     @staticmethod
     def isKeyword(tokenText):
-        for kind in TokenType:
-            if kind.name.lower() == tokenText and kind.value > TokenType.RESERVED_KEYWORD_START.value and kind.value< TokenType.RESERVED_KEYWORD_END.value:
-                return kind
-        return TokenType.IDENT
+        return KEYWORDS.get(tokenText, TokenType.IDENT)
 
 import enum
 class TokenType(enum.Enum):
@@ -196,8 +199,11 @@ class TokenType(enum.Enum):
     FOR = 109
     FUNC = 112
     RETURN = 113
+    GO = 114
     INT = 120
     FLOAT = 121
+    CHAN = 122
+    MAKE = 123
     RESERVED_KEYWORD_END = 200
     # Operators.
     EQ = 201  
@@ -217,4 +223,199 @@ class TokenType(enum.Enum):
     LBRACE = 214 # {
     RBRACE = 215 # }   
     COMMA = 216 # ,
-    
\ No newline at end of file
+    ARROW = 217 # <-
+
+# keyword text -> kind, for the kinds between the RESERVED_KEYWORD markers
+KEYWORDS = {
+    kind.name.lower(): kind
+    for kind in TokenType
+    if TokenType.RESERVED_KEYWORD_START.value < kind.value < TokenType.RESERVED_KEYWORD_END.value
+}
+    
+
+import re
+
+# leading blanks, then one alternative per token class tried in order
+TOKEN_REGEX = re.compile(r'''
+    [ \r\t]*
+    (?:
+        (?P<IDENT>[A-Za-z][A-Za-z0-9]*)
+      | (?P<COMMENT>//[^\n]*)
+      | (?P<OP>==|!=|>=|<=|<-|[-+*/(){},=<>])
+      | (?P<NEWLINE>\n)
+      | (?P<FLOAT_NUM>[0-9]+\.[0-9]+)
+      | (?P<BAD_NUM>[0-9]+\.)
+      | (?P<INT_NUM>[0-9]+)
+      | (?P<STRING>"[^"\r\n\t\\%]*")
+      | (?P<BAD_STRING>"[^"\r\n\t\\%]*)
+      | (?P<EOF>\0)
+    )
+''', re.VERBOSE)
+
+OPERATOR_TOKENS = {
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.MULTI,
+    "/": TokenType.DIVID,
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN,
+    "{": TokenType.LBRACE,
+    "}": TokenType.RBRACE,
+    ",": TokenType.COMMA,
+    "=": TokenType.EQ,
+    "==": TokenType.EQEQ,
+    "!=": TokenType.NOTEQ,
+    ">": TokenType.GT,
+    ">=": TokenType.GTEQ,
+    "<": TokenType.LT,
+    "<=": TokenType.LTEQ,
+    "<-": TokenType.ARROW,
+}
+
+class RegexLexer(Lexer):
+    """Lexer matching a whole token per step with TOKEN_REGEX.
+
+    Produces the same tokens, positions and errors as Lexer: a token's
+    column is the column of its last character, and the first line is
+    offset by two as Lexer counts it. TOKEN_REGEX only knows ASCII, tokens
+    touching other characters are left to Lexer.getToken.
+    """
+    def __init__(self, fname, input):
+        super().__init__(fname, input)
+        # the generator's own __next__ saves a method call per token
+        self.getToken = self.tokens().__next__
+    
+    def fail(self, pos, line, base, error_code, msg):
+        self.curLine = line
+        self.curCol = pos - base
+        self.abort(error_code, msg)
+    
+    def refill(self, pos):
+        # the whole source is in memory, nothing more to read
+        return None
+    
+    def tokens(self):
+        source = self.source
+        end = len(source)
+        match = TOKEN_REGEX.match
+        keyword = KEYWORDS.get
+        IDENT = TokenType.IDENT
+        # only then can a token run on into a character the regex misses
+        check_next = not source.isascii()
+        # text past `safe` may still be cut short by a later chunk
+        safe = end
+        pos = 0
+        line = 1
+        # column of position p is p - base
+        base = -2
+        
+        while True:
+            m = match(source, pos)
+            if m is None or m.end() > safe or (check_next and m.end() < end and not source[m.end()].isascii()):
+                if (pos if m is None else m.end() - 1) >= safe:
+                    # out of text, or the token may go on in the next chunk
+                    shift = self.refill(pos)
+                    if shift is None:
+                        break
+                    source = self.source
+                    end = len(source)
+                    check_next = not source.isascii()
+                    safe = self.safeEnd()
+                    pos -= shift
+                    base -= shift
+                    continue
+                # unknown or non-ASCII character, step the char lexer over it
+                self.curPos = pos
+                self.curChar = source[pos]
+                self.curLine = line
+                self.curCol = pos - base
+                yield Lexer.getToken(self)
+                pos = self.curPos
+                line = self.curLine
+                base = pos - self.curCol
+                continue
+            
+            group = m.lastgroup
+            pos = m.end()
+            if group == "IDENT":
+                text = m.group(group)
+                yield Token(text, keyword(text, IDENT), line, pos - 1 - base)
+            elif group == "OP":
+                text = m.group(group)
+                yield Token(text, OPERATOR_TOKENS[text], line, pos - 1 - base)
+            elif group == "NEWLINE":
+                yield Token("\n", TokenType.NEWLINE, line, pos - 1 - base)
+                line += 1
+                base = pos
+            elif group == "INT_NUM":
+                yield Token(m.group(group), TokenType.INT_NUM, line, pos - 1 - base)
+            elif group == "FLOAT_NUM":
+                yield Token(m.group(group), TokenType.FLOAT_NUM, line, pos - 1 - base)
+            elif group == "COMMENT":
+                pass
+            elif group == "STRING":
+                yield Token(m.group(group)[1:-1], TokenType.STRING, line, pos - 1 - base)
+            elif group == "BAD_NUM":
+                self.fail(pos - 1, line, base, ErrorCode.ILLEGAL_CHAR, "Illegal character in number : .")
+            elif group == "BAD_STRING":
+                bad = source[pos] if pos < end else "\0"
+                self.fail(pos, line, base, ErrorCode.ILLEGAL_CHAR, "Illegal character in string : %s" % bad)
+            elif group == "EOF":
+                yield Token("\0", TokenType.EOF, line, pos - 1 - base)
+        
+        # Lexer keeps stepping past the end, one column per call
+        while True:
+            yield Token("\0", TokenType.EOF, line, pos - base)
+            pos += 1
+
+
+import codecs
+
+class StreamLexer(RegexLexer):
+    """RegexLexer reading its source in chunks from a file object.
+
+    `stream.read(n)` may return str, or bytes decoded as UTF-8 (e.g. an
+    mmap). Only the text from the current token on is kept, and since no
+    token spans a newline the buffer always reaches past the next one.
+    `suffix` is added once the stream runs out.
+    """
+    def __init__(self, fname, stream, chunk_size=1 << 16, suffix=""):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.suffix = suffix
+        self.exhausted = False
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        super().__init__(fname, "")
+        
+    def safeEnd(self):
+        if self.exhausted:
+            return len(self.source)
+        # a token ending before the last newline can't grow any more
+        return self.source.rfind("\n") + 1
+    
+    def readChunk(self):
+        while True:
+            chunk = self.stream.read(self.chunk_size)
+            if not isinstance(chunk, bytes):
+                return chunk or ""
+            text = self.decoder.decode(chunk, final=not chunk)
+            # a chunk may end inside a multi-byte character
+            if text or not chunk:
+                return text
+    
+    def refill(self, pos):
+        if self.exhausted:
+            return None
+        # drop what is already lexed, then read up to a newline past pos
+        source = self.source[pos:]
+        while True:
+            chunk = self.readChunk()
+            if not chunk:
+                self.exhausted = True
+                source += self.suffix
+                break
+            source += chunk
+            if "\n" in chunk:
+                break
+        self.source = source
+        return pos
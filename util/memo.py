@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+# marks a cache miss, None is a valid function result
+MISSING = object()
+
+
+class MemoCache:
+    """Bounded LRU cache of one pure function's results keyed by argument tuple."""
+
+    def __init__(self, name, maxsize=1024):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def get(self, key):
+        result = self._results.get(key, MISSING)
+        if result is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._results.move_to_end(key)
+        return result
+
+    def set(self, key, result):
+        self._results[key] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def __len__(self):
+        return len(self._results)
+
+    def __str__(self):
+        return "%-16s %8d hits %8d misses %6d entries" % (self.name, self.hits, self.misses, len(self))
+
+    __repr__ = __str__
+
+
+class MemoTable:
+    """The memo caches of one run, one per pure function."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.caches = {}
+
+    def cache(self, func, name):
+        # keyed by the function itself, nested functions may share a name
+        cache = self.caches.get(func)
+        if cache is None:
+            cache = self.caches[func] = MemoCache(name, self.maxsize)
+        return cache
+
+    def report(self):
+        if not self.caches:
+            return "    no pure function was called"
+        return "\n".join("    %s" % cache for cache in self.caches.values())
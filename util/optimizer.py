@@ -0,0 +1,510 @@
+import time
+import operator
+from util.parser import *
+from util.semantic_analyzer import NodeVisitor
+from util.transpiler import skip_plus
+from util.parallel import functions
+from util.jit import walk
+
+
+class Transformer(NodeVisitor):
+    """Walk an analyzed tree, replacing every child with what its visit returns.
+
+    StatesList objects are updated in place because FuncSymbol.statementlist
+    shares them with the FuncBlock.
+    """
+
+    name = "transform"
+
+    def __init__(self):
+        self.rewrites = 0
+        # lines added under the pass in Optimizer.report
+        self.details = []
+
+    def run(self, tree):
+        return self.visit(tree)
+
+    def visit_Program(self, node):
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_Block(self, node):
+        for func in node.functions:
+            self.visit(func)
+        return node
+
+    def visit_FuncBlock(self, node):
+        self.visit(node.statementlist)
+        return node
+
+    def visit_StatesList(self, node):
+        node.states = [self.visit(state) for state in node.states]
+        return node
+
+    def visit_IfStatement(self, node):
+        node.cond = self.visit(node.cond)
+        self.visit(node.states)
+        return node
+
+    def visit_ForStatement(self, node):
+        node.cond = self.visit(node.cond)
+        self.visit(node.states)
+        return node
+
+    def visit_RetDecl(self, node):
+        node.val = self.visit(node.val)
+        return node
+
+    def visit_AssignOp(self, node):
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_FuncCall(self, node):
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    def visit_ConditionOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_BinOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_VarDecl(self, node):
+        return node
+
+    def visit_Ident(self, node):
+        return node
+
+    def visit_Num(self, node):
+        return node
+
+    def visit_LabelDecl(self, node):
+        return node
+
+    def visit_GotoDecl(self, node):
+        return node
+
+    def visit_GoStatement(self, node):
+        self.visit(node.call)
+        return node
+
+    def visit_SendStatement(self, node):
+        node.value = self.visit(node.value)
+        return node
+
+    def visit_RecvOp(self, node):
+        return node
+
+    def visit_MakeChan(self, node):
+        if node.size is not None:
+            node.size = self.visit(node.size)
+        return node
+
+
+def make_num(value, pos):
+    return Num(value, "float" if isinstance(value, float) else "int").at(pos)
+
+
+def is_int_const(node, value):
+    return isinstance(node, Num) and node.type == "int" and node.value == value
+
+
+class UnaryPlusElimination(Transformer):
+    """Drop the "+" placeholder Parser.unary wraps around every primary."""
+
+    name = "unary-plus"
+
+    def visit_UnaryOp(self, node):
+        node.right = self.visit(node.right)
+        if node.opfunc is None:
+            self.rewrites += 1
+            return node.right
+        # -(-x)
+        if isinstance(node.right, UnaryOp) and node.opfunc is operator.neg and node.right.opfunc is operator.neg:
+            self.rewrites += 1
+            return node.right.right
+        return node
+
+
+class ConstantFolding(Transformer):
+    """Evaluate operators whose operands are all Num literals.
+
+    The operators are the typed evaluators the SemanticAnalyzer bound, so
+    results keep the static type of the expression.
+    """
+
+    name = "constant-fold"
+
+    def visit_UnaryOp(self, node):
+        node.right = self.visit(node.right)
+        if isinstance(node.right, Num):
+            self.rewrites += 1
+            if node.opfunc is None:
+                return node.right
+            return make_num(node.opfunc(node.right.value), node)
+        return node
+
+    def visit_BinOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if isinstance(node.left, Num) and isinstance(node.right, Num):
+            try:
+                value = node.opfunc(node.left.value, node.right.value)
+            except ZeroDivisionError:
+                # keep it, the error belongs to run time
+                return node
+            self.rewrites += 1
+            return make_num(value, node)
+        return node
+
+
+class AlgebraicSimplification(Transformer):
+    """Rewrite x+0, 0+x, x-0, x*1 and 1*x to x.
+
+    Only int literals are identities here. The SemanticAnalyzer converted
+    every literal to the type of its other operand, and for floats x + 0.0
+    is not x when x is -0.0.
+    """
+
+    name = "algebraic"
+
+    def visit_BinOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        kind = node.op.kind
+        if kind == TokenType.PLUS:
+            if is_int_const(node.right, 0):
+                self.rewrites += 1
+                return node.left
+            if is_int_const(node.left, 0):
+                self.rewrites += 1
+                return node.right
+        elif kind == TokenType.MINUS:
+            if is_int_const(node.right, 0):
+                self.rewrites += 1
+                return node.left
+        elif kind == TokenType.MULTI:
+            if is_int_const(node.right, 1):
+                self.rewrites += 1
+                return node.left
+            if is_int_const(node.left, 1):
+                self.rewrites += 1
+                return node.right
+        return node
+
+
+def copy_tree(node, memo):
+    """Copy an analyzed expression or statement. Symbols, tokens and
+    operators are shared, nodes referenced twice (RetDecl.tailcall) are
+    copied once through `memo`."""
+    if id(node) in memo:
+        return memo[id(node)]
+    new = memo[id(node)] = object.__new__(type(node))
+    for cls in type(node).__mro__:
+        for field in getattr(cls, "__slots__", ()):
+            if not hasattr(node, field):
+                continue
+            value = getattr(node, field)
+            if isinstance(value, AST):
+                value = copy_tree(value, memo)
+            elif isinstance(value, list):
+                value = [copy_tree(item, memo) if isinstance(item, AST) else item for item in value]
+            setattr(new, field, value)
+    return new
+
+
+class FunctionInlining(Transformer):
+    """Substitute the bodies of small non-recursive functions at their calls.
+
+    A callee qualifies when its body has at most `max_size` nodes, no nested
+    function, and returns only in a last top level "return". Its parameters
+    and variables get fresh slots in the caller's frame, named
+    "<callee>_<name>", numbered from the second call site on; TinyGo names
+    have no "_", so they never clash with the caller's own.
+    A call statement is replaced by the parameter assignments and the body;
+    a call in an expression has them inserted before its statement and is
+    replaced by the returned expression. That moves the call ahead of what
+    its statement evaluates first, so it is only done when nothing there has
+    side effects, and when the callee or its arguments have side effects,
+    when nothing there reads a variable. Conditions of for loops are
+    evaluated again every iteration and are left alone. Callees are
+    inlined into first, and a caller grows by at most `max_growth` nodes.
+    """
+
+    name = "inline"
+
+    def __init__(self, max_size=40, max_growth=400):
+        super().__init__()
+        self.max_size = max_size
+        self.max_growth = max_growth
+        # FuncSymbol -> (body statements, returned expression or None, nodes),
+        # None if it doesn't qualify
+        self.shapes = {}
+        self.caller = None
+        self.grown = 0
+        # statements to insert before the current one, and whether what it
+        # evaluated so far, and is not moved ahead, reads variables or has side effects
+        self.prelude = None
+        self.reads = self.effects = False
+
+    def run(self, tree):
+        funcs = functions(tree)
+        self.parents = {}
+        for func_sym in funcs:
+            for node in walk(func_sym.statementlist):
+                if type(node) is FuncBlock:
+                    self.parents[node.func_sym] = func_sym
+        for func_sym in self.order(funcs):
+            self.caller, self.grown = func_sym, 0
+            self.visit(func_sym.statementlist)
+        return tree
+
+    def order(self, funcs):
+        # callees before their callers
+        done, order = set(), []
+
+        def visit(func_sym):
+            done.add(func_sym)
+            for callee in func_sym.callees:
+                if callee not in done:
+                    visit(callee)
+            order.append(func_sym)
+
+        for func_sym in funcs:
+            if func_sym not in done:
+                visit(func_sym)
+        return order
+
+    def shape(self, func_sym):
+        if func_sym in self.shapes:
+            return self.shapes[func_sym]
+        states = func_sym.statementlist.states
+        nodes = list(walk(func_sym.statementlist))
+        returns = [node for node in nodes if type(node) is RetDecl]
+        shape = None
+        if (len(nodes) <= self.max_size and not self.recursive(func_sym)
+                and not any(type(node) in (FuncBlock, LabelDecl, GotoDecl) for node in nodes)):
+            if not returns:
+                shape = (states, None, len(nodes))
+            elif len(returns) == 1 and states[-1] is returns[0]:
+                shape = (states[:-1], returns[0].val, len(nodes))
+        self.shapes[func_sym] = shape
+        return shape
+
+    def recursive(self, func_sym):
+        seen, stack = set(), list(func_sym.callees)
+        while stack:
+            callee = stack.pop()
+            if callee is func_sym:
+                return True
+            if callee not in seen:
+                seen.add(callee)
+                stack.extend(callee.callees)
+        return False
+
+    def changes(self, func_sym):
+        # may write a variable outside its frame, call, or use a channel
+        for node in walk(func_sym.statementlist):
+            kind = type(node)
+            if kind is AssignOp and node.depth < func_sym.level:
+                return True
+            if kind in (FuncCall, GoStatement, SendStatement, RecvOp, MakeChan):
+                return True
+        return False
+
+    def shadowed(self, func_sym):
+        # a name of the callee's enclosing scopes that the caller declares again
+        hidden = set()
+        scope = self.caller
+        while scope is not None and scope.level > func_sym.level - 1:
+            hidden.update(scope.varnames)
+            scope = self.parents.get(scope)
+        for node in walk(func_sym.statementlist):
+            kind = type(node)
+            if kind is Ident and node.depth < func_sym.level and node.text in hidden:
+                return True
+            if kind is AssignOp and node.depth < func_sym.level and node.left in hidden:
+                return True
+        return False
+
+    def fits(self, call):
+        func_sym = call.func_sym
+        shape = self.shape(func_sym)
+        return (shape is not None and self.grown + shape[2] <= self.max_growth
+                and not self.shadowed(func_sym))
+
+    def expand(self, call):
+        """Add the parameter assignments and the body of the callee to the
+        prelude, return the copy of its returned expression."""
+        func_sym, caller = call.func_sym, self.caller
+        states, result, size = self.shape(func_sym)
+        base = caller.nslots
+        taken = set(caller.varnames)
+        renamed = []
+        for name in func_sym.varnames:
+            new = "%s_%s" % (func_sym.name, name)
+            n = 1
+            while new in taken:
+                n += 1
+                new = "%s_%s_%d" % (func_sym.name, name, n)
+            renamed.append(new)
+        caller.varnames.extend(renamed)
+        caller.nslots += func_sym.nslots
+        caller.nlocals += func_sym.nslots
+        caller.callees.update(func_sym.callees)
+
+        for slot, arg in enumerate(call.args):
+            assign = AssignOp(renamed[slot], arg).at(call)
+            assign.depth, assign.slot = caller.level, base + slot
+            self.prelude.append(assign)
+        memo = {}
+        body = [copy_tree(state, memo) for state in states]
+        if result is not None:
+            result = copy_tree(result, memo)
+        copied = [node for state in body + ([result] if result is not None else []) for node in walk(state)]
+        for node in copied:
+            kind = type(node)
+            if kind in (Ident, AssignOp, VarDecl) and node.depth == func_sym.level:
+                name = renamed[node.slot]
+                node.depth, node.slot = caller.level, base + node.slot
+                if kind is Ident:
+                    node.text = name
+                elif kind is AssignOp:
+                    node.left = name
+                else:
+                    node.ident = name
+        self.prelude.extend(body)
+
+        self.grown += size
+        self.rewrites += 1
+        self.details.append("%s into %s at line %d" % (func_sym.name, caller.name, call.line))
+        return result
+
+    def note(self, node):
+        # a returned expression stays where the call was
+        for child in walk(node):
+            kind = type(child)
+            if kind is Ident:
+                self.reads = True
+            elif kind is FuncCall or kind is RecvOp:
+                self.effects = True
+
+    def visit_FuncBlock(self, node):
+        # nested functions are inlined into on their own, see run
+        return node
+
+    def visit_StatesList(self, node):
+        states = []
+        for state in node.states:
+            outer = self.prelude, self.reads, self.effects
+            self.prelude, self.reads, self.effects = [], False, False
+            if type(state) is FuncCall:
+                replaced = self.call_statement(state)
+            else:
+                replaced = [self.visit(state)]
+            states.extend(self.prelude)
+            states.extend(replaced)
+            self.prelude, self.reads, self.effects = outer
+        node.states = states
+        return node
+
+    def call_statement(self, node):
+        node.args = [self.visit(arg) for arg in node.args]
+        if not self.fits(node):
+            return [node]
+        _, result, _ = self.shape(node.func_sym)
+        if result is not None:
+            inner = skip_plus(result)
+            kept = type(inner) is FuncCall
+            # the value is dropped, but not a call or an error it may raise
+            if not kept and any(type(child) in (FuncCall, RecvOp) or
+                                type(child) is BinOp and child.op.kind == TokenType.DIVID for child in walk(result)):
+                return [node]
+        result = self.expand(node)
+        if result is not None and type(skip_plus(result)) is FuncCall:
+            return [skip_plus(result)]
+        return []
+
+    def visit_ForStatement(self, node):
+        self.visit(node.states)
+        return node
+
+    def visit_RetDecl(self, node):
+        node.val = self.visit(node.val)
+        val = skip_plus(node.val)
+        node.tailcall = val if type(val) is FuncCall else None
+        return node
+
+    def visit_GoStatement(self, node):
+        # the call runs later, on its own goroutine
+        self.effects = True
+        return node
+
+    def visit_RecvOp(self, node):
+        self.effects = True
+        return node
+
+    def visit_MakeChan(self, node):
+        super().visit_MakeChan(node)
+        self.effects = True
+        return node
+
+    def visit_Ident(self, node):
+        self.reads = True
+        return node
+
+    def visit_FuncCall(self, node):
+        reads, effects = self.reads, self.effects
+        node.args = [self.visit(arg) for arg in node.args]
+        func_sym = node.func_sym
+        shape = self.shape(func_sym)
+        if (effects or shape is None or shape[1] is None or not self.fits(node)
+                or reads and (self.effects or self.changes(func_sym))):
+            self.effects = self.effects or not func_sym.pure
+            return node
+        # the arguments move ahead with the body
+        self.reads, self.effects = reads, effects
+        result = self.expand(node)
+        self.note(result)
+        return result
+
+
+DEFAULT_PASSES = [
+    UnaryPlusElimination,
+    ConstantFolding,
+    AlgebraicSimplification,
+    FunctionInlining,
+]
+
+
+class Optimizer:
+    """Run optimization passes over an analyzed tree, between SemanticAnalyzer.analyze
+    and Interpreter.interpret, and keep per-pass statistics."""
+
+    def __init__(self, passes=DEFAULT_PASSES):
+        self.passes = passes
+        # (pass name, rewrites, seconds)
+        self.stats = []
+
+    def optimize(self, tree):
+        for pass_class in self.passes:
+            opt = pass_class()
+            start = time.perf_counter()
+            tree = opt.run(tree)
+            self.stats.append((opt.name, opt.rewrites, time.perf_counter() - start, opt.details))
+        return tree
+
+    def report(self):
+        lines = []
+        for name, rewrites, seconds, details in self.stats:
+            lines.append("    %-16s %6d rewrites %9.3f ms" % (name, rewrites, seconds * 1000))
+            lines.extend("        %s" % detail for detail in details)
+        return "\n".join(lines)
@@ -0,0 +1,144 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from util.parser import BinOp, FuncCall, FuncBlock
+from util.interpreter import Interpreter, ActivationRecord, ARType
+from util.transpiler import skip_plus
+from util.jit import walk
+
+
+def functions(tree):
+    """Every FuncSymbol of the tree, in the same order in every process."""
+    found = []
+    blocks = list(tree.block.functions)
+    while blocks:
+        func = blocks.pop(0)
+        found.append(func.func_sym)
+        blocks.extend(node for node in walk(func.statementlist) if type(node) is FuncBlock)
+    return found
+
+
+def fork_points(tree):
+    """BinOps whose operands are both calls of pure functions, the two
+    calls can run at the same time."""
+    found = set()
+    for func_sym in functions(tree):
+        for node in walk(func_sym.statementlist):
+            if type(node) is BinOp:
+                left, right = skip_plus(node.left), skip_plus(node.right)
+                if type(left) is FuncCall and type(right) is FuncCall and left.func_sym.pure and right.func_sym.pure:
+                    found.add(node)
+    return found
+
+
+def outer_records(level):
+    # a pure function never reads them, its nested callees only look them up
+    ar = None
+    for nested_level in range(1, level):
+        ar = ActivationRecord(
+            name = "<fork>",
+            type = ARType.PROGRAM if nested_level == 1 else ARType.FUNCTION,
+            nested_level = nested_level,
+            enclosing = ar,
+        )
+    return ar
+
+
+# the tree's functions in a worker process, see start_worker
+_functions = None
+
+
+def start_worker(tree):
+    global _functions
+    _functions = functions(tree)
+
+
+def run_call(index, args):
+    """Run one pure call sequentially in a worker process."""
+    func_sym = _functions[index]
+    enclosing = outer_records(func_sym.level)
+    interpreter = Interpreter(None)
+    interpreter.callstack.push(enclosing)
+    return interpreter.call(func_sym, args, enclosing)
+
+
+def default_depth(workers):
+    # about four leaf tasks per worker, so idle ones pick up the slack
+    depth = 1
+    while 2 ** depth < 4 * workers:
+        depth += 1
+    return depth
+
+
+class ParallelInterpreter(Interpreter):
+    """Interpreter evaluating independent pure calls on a process pool.
+
+    At a fork point, a BinOp of two pure calls, the arguments are
+    evaluated here. While `depth` forks are not yet open on the way to it,
+    the left call runs on a thread with a child interpreter and the right
+    one here, both one fork deeper. The calls at the last fork level go
+    to the pool and run sequentially there, so there are 2 ** `depth`
+    of them and workers take the next one as they get idle. Below the
+    cutoff, and in programs without fork points, everything runs here
+    and no process is started. Results of pure calls don't depend on the
+    order, but only the first runtime error raised is reported. A
+    MemoTable only caches the calls made by this interpreter.
+    """
+
+    def __init__(self, tree, memo=None, workers=None, depth=None, forks=0, parent=None):
+        super().__init__(tree, memo)
+        if parent is None:
+            self.workers = workers or os.cpu_count() or 1
+            self.depth = depth if depth is not None else default_depth(self.workers)
+            self.fork_points = fork_points(tree)
+            self.index = {func_sym: i for i, func_sym in enumerate(functions(tree))}
+            self.pool = self.threads = None
+        else:
+            # a child shares the pools with its parent, it only has its own CallStack
+            self.workers, self.depth = parent.workers, parent.depth
+            self.fork_points, self.index = parent.fork_points, parent.index
+            self.pool, self.threads = parent.pool, parent.threads
+        # forks open on the way to the node being evaluated
+        self.forks = forks
+
+    def run(self):
+        try:
+            return super().run()
+        finally:
+            if self.pool is not None:
+                self.threads.shutdown()
+                self.pool.shutdown()
+
+    def start(self):
+        self.pool = ProcessPoolExecutor(self.workers, initializer=start_worker, initargs=(self.tree,))
+        # get the workers going before any thread is, forking a threaded process is unsafe
+        self.pool.submit(int).result()
+        # every fork above the last level waits on one thread
+        self.threads = ThreadPoolExecutor(2 ** self.depth)
+
+    def visit_BinOp(self, node):
+        if self.forks >= self.depth or node not in self.fork_points:
+            return node.opfunc(self.visit(node.left), self.visit(node.right))
+        if self.pool is None:
+            self.start()
+        left, right = skip_plus(node.left), skip_plus(node.right)
+        left_args = [self.visit(arg) for arg in left.args]
+        right_args = [self.visit(arg) for arg in right.args]
+        forks = self.forks + 1
+        if forks == self.depth:
+            future = self.pool.submit(run_call, self.index[left.func_sym], left_args)
+            other = self.pool.submit(run_call, self.index[right.func_sym], right_args)
+            return node.opfunc(future.result(), other.result())
+        future = self.threads.submit(self.fork, left.func_sym, left_args, forks)
+        self.forks = forks
+        try:
+            value = self.call(right.func_sym, right_args, self.callstack.peek().lookup(right.func_sym.level - 1))
+        finally:
+            self.forks = forks - 1
+        return node.opfunc(future.result(), value)
+
+    def fork(self, func_sym, args, forks):
+        child = ParallelInterpreter(self.tree, forks=forks, parent=self)
+        enclosing = outer_records(func_sym.level)
+        child.callstack.push(enclosing)
+        return child.call(func_sym, args, enclosing)
@@ -1,6 +1,52 @@
+import math
+import operator
 from util.lexer import *
 from util.error import ParserError, ErrorCode
 
+# operator token -> function evaluating it, bound onto the node at parse time
+BINARY_FUNCS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.MULTI: operator.mul,
+    TokenType.DIVID: operator.truediv,
+    TokenType.EQEQ: operator.eq,
+    TokenType.NOTEQ: operator.ne,
+    TokenType.GT: operator.gt,
+    TokenType.GTEQ: operator.ge,
+    TokenType.LT: operator.lt,
+    TokenType.LTEQ: operator.le,
+}
+
+UNARY_FUNCS = {
+    TokenType.PLUS: None,
+    TokenType.MINUS: operator.neg,
+    # conversions, int() truncates toward zero like Go
+    TokenType.INT: int,
+    TokenType.FLOAT: float,
+}
+
+def int_div(a, b):
+    # Go truncates the quotient toward zero, Python's // floors it
+    q = a // b
+    if q < 0 and q * b != a:
+        q += 1
+    return q
+
+def float_div(a, b):
+    # Go gives an infinity or NaN where Python raises
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or a != a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+# arithmetic on operands of one static type, bound by the SemanticAnalyzer
+TYPED_FUNCS = {
+    "int": {**BINARY_FUNCS, TokenType.DIVID: int_div},
+    "float": {**BINARY_FUNCS, TokenType.DIVID: float_div},
+}
+
 class Parser:
     def __init__(self, lexer):
         self.lexer = lexer
@@ -47,7 +93,7 @@ class Parser:
         self.match(TokenType.IDENT)
         self.newline()
         
-        root = Block()
+        root = Block().at(pname)
         while not self.checkToken(TokenType.EOF):
             out = self.declaration()
             if isinstance(out, FuncBlock):
@@ -56,25 +102,22 @@ class Parser:
                 root.new_vardecl(out)
             self.newline()
         
-        return Program(pname, root)
+        return Program(pname, root).at(pname)
     
     #  "ident" type {"," "ident" type}
     #  a int | a int, b int | a,b int | empty
     def params(self):
         param_list = []
         if not self.checkToken(TokenType.RPAREN):
-            idents = [self.curToken.text]
+            idents = [self.curToken]
             self.nextToken()
             while self.checkToken(TokenType.COMMA):
                 self.nextToken()
-                idents.append(self.curToken.text)
-                self.nextToken()
-            if self.isIdentType():
-                for ident in idents:
-                    param_list.append(VarDecl(ident, self.curToken.text))
+                idents.append(self.curToken)
                 self.nextToken()
-            else:
-                self.abort(ErrorCode.UNEXPECTED_TOKEN,"Expected type , but found %s" % self.curToken.text)
+            type_ = self.identType()
+            for ident in idents:
+                param_list.append(VarDecl(ident.text, type_).at(ident))
             
             if self.checkToken(TokenType.COMMA):
                 self.nextToken()
@@ -86,10 +129,8 @@ class Parser:
          
     # type | "(" type (, type)* ")"   
     def retTypes(self):
-        if self.isIdentType():
-            type_ = self.curToken.text
-            self.nextToken()
-            return type_
+        if self.isType():
+            return self.identType()
         
         # types = []
         # if not self.checkToken(TokenType.LPAREN):
@@ -125,6 +166,7 @@ class Parser:
     
     def declaration(self):
         statement = None
+        token = self.curToken
         
         # "FUNC" ident "(" formal_param_list ")"  "{" {statement} "}"
         if self.checkToken(TokenType.FUNC):
@@ -146,22 +188,24 @@ class Parser:
             self.newline()
             
             
-            statementlist = StatesList()
+            statementlist = StatesList().at(token)
             while not self.checkToken(TokenType.RBRACE):
                 statementlist.append(self.statement())
             
             self.match(TokenType.RBRACE)
-            statement = FuncBlock(fname,params, rettypes, statementlist)
+            statement = FuncBlock(fname,params, rettypes, statementlist).at(token)
             
         # "VAR" ident identType
         elif self.checkToken(TokenType.VAR):
             self.nextToken()
             ident = self.curToken.text
             self.match(TokenType.IDENT)
-            if self.isIdentType():
+            if self.checkToken(TokenType.CHAN):
+                statement = VarDecl(ident, self.identType()).at(token)
+            elif self.isIdentType():
                 identType = self.curToken
                 self.nextToken()
-                statement = VarDecl(ident, identType)
+                statement = VarDecl(ident, identType).at(token)
             else:
                 self.abort(ErrorCode.SYNTAX_ERROR,"Only allowed variable declare outside function.")
         
@@ -173,6 +217,7 @@ class Parser:
         # print("Statement : %s" % self.curToken.kind.name)
         
         statement = self.declaration()
+        token = self.curToken
         
         # func / var 
         if statement:
@@ -186,12 +231,12 @@ class Parser:
             self.match(TokenType.LBRACE)
             self.newline()
             
-            statements = StatesList()
+            statements = StatesList().at(token)
             while not self.checkToken(TokenType.RBRACE):
                 statements.append(self.statement())
             
             self.match(TokenType.RBRACE)
-            statement = IfStatement(condition, statements)
+            statement = IfStatement(condition, statements).at(token)
         
         # "FOR" condition "{" {statement} "}"
         elif self.checkToken(TokenType.FOR):
@@ -201,12 +246,12 @@ class Parser:
             self.match(TokenType.LBRACE)
             self.newline()
             
-            statements = StatesList()
+            statements = StatesList().at(token)
             while not self.checkToken(TokenType.RBRACE):
                 statements.append(self.statement())
             
             self.match(TokenType.RBRACE)
-            statement = ForStatement(condition, statements)
+            statement = ForStatement(condition, statements).at(token)
             
         # "GOTO" ident
         elif self.checkToken(TokenType.GOTO):
@@ -214,14 +259,14 @@ class Parser:
             ident = self.curToken
             self.match(TokenType.IDENT)
         
-            statement = GotoDecl(ident)
+            statement = GotoDecl(ident).at(token)
           
         # "LABEL" ident
         elif self.checkToken(TokenType.LABEL):
             self.nextToken()
             ident = self.curToken
             self.match(TokenType.IDENT)
-            statement = LabelDecl(ident)
+            statement = LabelDecl(ident).at(token)
             
         # "RETURN" expression
         elif self.checkToken(TokenType.RETURN):
@@ -233,17 +278,33 @@ class Parser:
             #         self.nextToken()
             #         retVals.append(self.expression())
             
-            statement = RetDecl(self.expression())
+            statement = RetDecl(self.expression()).at(token)
             
-        # ident "=" expression  | ident()
+        # "GO" ident "(" (expression)* ")"
+        elif self.checkToken(TokenType.GO):
+            self.nextToken()
+            if not (self.checkToken(TokenType.IDENT) and self.checkPeek(TokenType.LPAREN)):
+                self.abort(ErrorCode.SYNTAX_ERROR,"Expression in go must be function call")
+            statement = GoStatement(self.funcCall()).at(token)
+            
+        # "<-" ident, waits for a value and drops it
+        elif self.checkToken(TokenType.ARROW):
+            statement = self.primary()
+            
+        # ident "=" expression  | ident() | ident "<-" expression
         elif self.checkToken(TokenType.IDENT):
             if self.checkPeek(TokenType.EQ):
                 ident = self.curToken.text
                 self.nextToken()
                 self.nextToken()
-                statement = AssignOp(ident, self.expression())
+                statement = AssignOp(ident, self.expression()).at(token)
             elif self.checkPeek(TokenType.LPAREN):
                 statement = self.funcCall()
+            elif self.checkPeek(TokenType.ARROW):
+                chan = Ident(token.text).at(token)
+                self.nextToken()
+                self.nextToken()
+                statement = SendStatement(chan, self.expression()).at(token)
         
         else:
             self.abort(ErrorCode.SYNTAX_ERROR,"Invalid statement  %s at (%s)" % ( self.curToken.text, self.curToken.kind.name))
@@ -252,7 +313,8 @@ class Parser:
         return statement
          
     def funcCall(self):
-        ident = self.curToken.text
+        token = self.curToken
+        ident = token.text
         self.nextToken()
         statement = None
         if self.checkToken(TokenType.LPAREN):
@@ -264,7 +326,7 @@ class Parser:
                     self.nextToken()
                     args.append(self.expression())
             self.match(TokenType.RPAREN)
-            statement = FuncCall(ident, args)
+            statement = FuncCall(ident, args).at(token)
         return statement
         
     def isValidNumber(self):
@@ -273,6 +335,20 @@ class Parser:
     def isIdentType(self):
         return self.checkToken(TokenType.INT) or self.checkToken(TokenType.FLOAT)
     
+    def isType(self):
+        return self.isIdentType() or self.checkToken(TokenType.CHAN)
+    
+    # type ::= "int" | "float" | "chan" type
+    def identType(self):
+        if self.checkToken(TokenType.CHAN):
+            self.nextToken()
+            return "chan " + self.identType()
+        if not self.isIdentType():
+            self.abort(ErrorCode.UNEXPECTED_TOKEN,"Expected type , but found %s" % self.curToken.text)
+        type_ = self.curToken.text
+        self.nextToken()
+        return type_
+    
     # condition ::= expression (("==" | "!=" | ">" | ">=" | "<" | "<=") expression)
     def condition(self):
         left = self.expression()
@@ -283,7 +359,7 @@ class Parser:
         else:
             self.abort(ErrorCode.UNEXPECTED_TOKEN,"Expected condition operator at : %s " % self.curToken.text)
         
-        return ConditionOp(left,op, right)        
+        return ConditionOp(left,op, right).at(op)        
         # while self.isCmpOp():
         #     self.nextToken()
         #     self.expression()
@@ -296,7 +372,7 @@ class Parser:
             preToken = self.curToken
             self.nextToken()
             
-            node = BinOp(left=node, op=preToken, right = self.term())
+            node = BinOp(left=node, op=preToken, right = self.term()).at(preToken)
         
         return node
     
@@ -307,39 +383,58 @@ class Parser:
         while self.checkToken(TokenType.MULTI) or self.checkToken(TokenType.DIVID):
             preToken = self.curToken
             self.nextToken()
-            node = BinOp(left=node, op=preToken, right = self.unary())
+            node = BinOp(left=node, op=preToken, right = self.unary()).at(preToken)
         return node
     
     # unary ::= ["+" | "-"] primary
     def unary(self):
         # print("Unary")
         op = TokenType.PLUS
+        token = self.curToken
         if self.checkToken(TokenType.PLUS) or self.checkToken(TokenType.MINUS):
             op = self.curToken
             self.nextToken()
-        return UnaryOp(op, self.primary())
+        return UnaryOp(op, self.primary()).at(token)
     
-    # primary ::= number | ident "(" (expression)* ")" | "(" expression ")"
+    # primary ::= number | ident "(" (expression)* ")" | type "(" expression ")" | "(" expression ")"
+    #           | "<-" primary | "make" "(" "chan" type ["," expression] ")"
     def primary(self):
-        preToken = self.curToken.text
+        token = self.curToken
+        preToken = token.text
         if self.checkToken(TokenType.INT_NUM):
             self.nextToken()
-            return Num(int(preToken), "int")
+            return Num(int(preToken), "int").at(token)
         elif self.checkToken(TokenType.FLOAT_NUM):
             self.nextToken()
-            return Num(float(preToken), "float")
+            return Num(float(preToken), "float").at(token)
         elif self.checkToken(TokenType.IDENT):
+            if self.checkPeek(TokenType.LPAREN):
+                return self.funcCall()
             self.nextToken()
-            if not self.checkToken(TokenType.LPAREN):
-                return Ident(preToken)
-            else:
-                # function call
+            return Ident(preToken).at(token)
+        elif self.isIdentType():
+            # conversion, a UnaryOp with the type token as operator
+            self.nextToken()
+            self.match(TokenType.LPAREN)
+            node = UnaryOp(token, self.expression()).at(token)
+            self.match(TokenType.RPAREN)
+            return node
+        elif self.checkToken(TokenType.ARROW):
+            # receive, blocks until a value is sent
+            self.nextToken()
+            return RecvOp(self.primary()).at(token)
+        elif self.checkToken(TokenType.MAKE):
+            self.nextToken()
+            self.match(TokenType.LPAREN)
+            if not self.checkToken(TokenType.CHAN):
+                self.abort(ErrorCode.UNEXPECTED_TOKEN,"Expected chan , but found %s" % self.curToken.text)
+            type_ = self.identType()
+            size = None
+            if self.checkToken(TokenType.COMMA):
                 self.nextToken()
-                args = []
-                while not self.checkToken(TokenType.RPAREN):
-                    args.append(self.expression())
-                self.match(TokenType.RPAREN)
-                return FuncCall(preToken, args)
+                size = self.expression()
+            self.match(TokenType.RPAREN)
+            return MakeChan(type_, size).at(token)
         elif self.checkToken(TokenType.LPAREN):
             self.nextToken()
             node = None
@@ -354,14 +449,27 @@ class Parser:
             
 
 class AST:
-    pass
+    # nodes only hold the fields they declare, no per-instance __dict__
+    __slots__ = ("line", "col")
+
+    def at(self, pos):
+        # take the source position of a Token or of another node
+        self.line = pos.line
+        self.col = pos.col
+        return self
 
 class Program(AST):
+    __slots__ = ("package", "block", "nslots", "main")
+
     def __init__(self, package, block):
         self.package = package
         self.block = block
+        self.nslots = 0
+        self.main = None # FuncSymbol of main
         
 class Block(AST):
+    __slots__ = ("vardecls", "functions")
+
     def __init__(self):
         self.vardecls = []
         self.functions = []
@@ -374,40 +482,66 @@ class Block(AST):
     
     
 class FuncBlock(AST):
+    __slots__ = ("name", "params", "rettypes", "statementlist", "func_sym")
+
     def __init__(self,name, params, rettypes ,statementlist):
         self.name = name
         self.params = params
         self.rettypes = rettypes
         self.statementlist = statementlist
+        
+        self.func_sym = None
   
 class FuncCall(AST):
+    __slots__ = ("name", "args", "func_sym", "type")
+
     def __init__(self, name, args=[]):
         self.name = name
         self.args = args
         
         self.func_sym = None # point to func_declaration
+        self.type = None # result type, None without one
       
 class VarDecl(AST):
+    __slots__ = ("ident", "type", "depth", "slot")
+
     def __init__(self, ident, type):
         self.ident = ident
         self.type = type
         
+        self.depth = self.slot = None # frame address
+    
+    @property
+    def typename(self):
+        # "var" declarations keep the type token, parameters its text
+        return self.type.text if isinstance(self.type, Token) else self.type
+        
 class IfStatement(AST):
+    __slots__ = ("cond", "states")
+
     def __init__(self, condition, statesList):
         self.cond = condition
         self.states = statesList
     
 class ForStatement(AST):
+    __slots__ = ("cond", "states")
+
     def __init__(self, condition, statesList):
         self.cond = condition
         self.states = statesList
     
 class AssignOp(AST):
+    __slots__ = ("left", "right", "depth", "slot")
+
     def __init__(self,ident,expression):
         self.left = ident
         self.right = expression
         
+        self.depth = self.slot = None # frame address
+        
 class StatesList(AST):
+    __slots__ = ("states",)
+
     def __init__(self):
         self.states = []
 
@@ -415,40 +549,98 @@ class StatesList(AST):
         self.states.append(state)
         
 class LabelDecl(AST):
+    __slots__ = ("ident",)
+
     def __init__(self, ident):
         self.ident = ident
         
 class GotoDecl(AST):
+    __slots__ = ("ident",)
+
     def __init__(self,ident):
         self.ident = ident
   
 class RetDecl(AST):
+    __slots__ = ("val", "tailcall")
+
     def __init__(self, retvals):
         self.val = retvals
+        
+        self.tailcall = None # FuncCall returned directly
+      
+class GoStatement(AST):
+    __slots__ = ("call",)
+
+    def __init__(self, call):
+        self.call = call # FuncCall run on a new goroutine
+        
+class SendStatement(AST):
+    __slots__ = ("chan", "value")
+
+    def __init__(self, chan, value):
+        self.chan = chan
+        self.value = value
+        
+class RecvOp(AST):
+    __slots__ = ("chan", "type")
+
+    def __init__(self, chan):
+        self.chan = chan
+        self.type = None # element type
+
+# expressions allowed as statements, their value is dropped
+EXPR_STATEMENTS = (FuncCall, RecvOp)
+        
+class MakeChan(AST):
+    __slots__ = ("type", "size")
+
+    def __init__(self, type, size):
+        self.type = type # "chan int"
+        self.size = size # buffer size expression, None for unbuffered
       
 class ConditionOp(AST):
+    __slots__ = ("left", "token", "op", "right", "opfunc")
+
     def __init__(self, left, op, right):
         self.left = left
         self.token = self.op = op
         self.right = right
+        self.opfunc = BINARY_FUNCS[op.kind]
     
 class UnaryOp(AST):
+    __slots__ = ("token", "op", "right", "opfunc", "type")
+
     def __init__(self, op, right):
         self.token = self.op = op
         self.right = right
+        # None for the "+" placeholder built by Parser.unary
+        self.opfunc = UNARY_FUNCS[op.kind if isinstance(op, Token) else op]
+        self.type = None # static type, set by the SemanticAnalyzer
 
     
 class BinOp(AST):
+    __slots__ = ("left", "token", "op", "right", "opfunc", "type")
+
     def __init__(self, left, op, right):
         self.left = left
         self.token = self.op = op
         self.right = right
+        # rebound from TYPED_FUNCS once the operand type is known
+        self.opfunc = BINARY_FUNCS[op.kind]
+        self.type = None
 
 class Ident(AST):
+    __slots__ = ("text", "depth", "slot", "type")
+
     def __init__(self, text):
         self.text = text
         
+        self.depth = self.slot = None # frame address
+        self.type = None
+        
 class Num(AST):
+    __slots__ = ("value", "type")
+
     def __init__(self, value, type):
         self.value = value
         self.type = type        
@@ -0,0 +1,175 @@
+import time
+
+from util.parser import FuncCall, EXPR_STATEMENTS
+from util.interpreter import Interpreter, CallStack, ARType
+
+
+class ProfileEntry:
+    """Profiler state of one running TinyGo function."""
+
+    def __init__(self, name, prefix, start):
+        self.name = name
+        # collapsed stack of the callers, "main:10;fib:7"
+        self.prefix = prefix
+        self.start = start
+        self.line = None
+        self.line_start = start
+
+
+class Profiler:
+    """Deterministic profiler of TinyGo functions and source lines.
+
+    Every CallStack push and pop and every statement the interpreter starts
+    is an event; the time since the previous event is charged to the
+    function and the line on top of the stack. Self time excludes callees,
+    total time includes them and counts recursive activations once.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stack = []
+        self.last = clock()
+        # seconds charged so far, the time base of total times
+        self.charged = 0.0
+        # name -> [calls, self, total]
+        self.functions = {}
+        # (name, line) -> [self, total]
+        self.lines = {}
+        # collapsed stack -> seconds
+        self.collapsed = {}
+        # activations on the stack, for counting recursion once
+        self.active = {}
+        self.active_lines = {}
+
+    def charge(self, now):
+        entry = self.stack[-1]
+        elapsed = now - self.last
+        self.charged += elapsed
+        self.functions[entry.name][1] += elapsed
+        self.lines.setdefault((entry.name, entry.line), [0.0, 0.0])[0] += elapsed
+        key = entry.prefix + frame_name(entry)
+        self.collapsed[key] = self.collapsed.get(key, 0.0) + elapsed
+
+    def enter(self, name):
+        now = self.clock()
+        if self.stack:
+            self.charge(now)
+            top = self.stack[-1]
+            prefix = top.prefix + frame_name(top) + ";"
+        else:
+            prefix = ""
+        stats = self.functions.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        self.active[name] = self.active.get(name, 0) + 1
+        self.stack.append(ProfileEntry(name, prefix, self.charged))
+        # the profiler's own work is not charged to the program
+        self.last = self.clock()
+
+    def leave(self):
+        now = self.clock()
+        self.charge(now)
+        entry = self.stack.pop()
+        self.close_line(entry)
+        self.active[entry.name] -= 1
+        if not self.active[entry.name]:
+            self.functions[entry.name][2] += self.charged - entry.start
+        self.last = self.clock()
+
+    def line(self, line):
+        if not self.stack:
+            return
+        entry = self.stack[-1]
+        if entry.line == line:
+            return
+        now = self.clock()
+        self.charge(now)
+        self.close_line(entry)
+        key = (entry.name, line)
+        self.active_lines[key] = self.active_lines.get(key, 0) + 1
+        entry.line = line
+        entry.line_start = self.charged
+        self.last = self.clock()
+
+    def close_line(self, entry):
+        if entry.line is None:
+            return
+        key = (entry.name, entry.line)
+        self.active_lines[key] -= 1
+        if not self.active_lines[key]:
+            self.lines.setdefault(key, [0.0, 0.0])[1] += self.charged - entry.line_start
+
+    def collapsed_stacks(self):
+        """Lines of "frame;frame;frame microseconds" for flamegraph.pl and
+        compatible viewers, every frame is "function:line"."""
+        return "\n".join("%s %d" % (stack, round(seconds * 1e6))
+                         for stack, seconds in sorted(self.collapsed.items()) if seconds >= 5e-7)
+
+    def report(self, source_lines=None, limit=20):
+        total = sum(stats[1] for stats in self.functions.values()) or 1.0
+        out = ["    %-20s %8s %11s %7s %11s" % ("function", "calls", "self ms", "self%", "total ms")]
+        for name, (calls, self_time, total_time) in sorted(self.functions.items(), key=lambda item: -item[1][1]):
+            out.append("    %-20s %8d %11.3f %6.1f%% %11.3f" % (
+                name, calls, self_time * 1000, self_time * 100 / total, total_time * 1000))
+        out.append("")
+        out.append("    %-6s %-20s %11s %7s %11s  %s" % ("line", "function", "self ms", "self%", "total ms", "source"))
+        rows = sorted(self.lines.items(), key=lambda item: -item[1][0])
+        for (name, line), (self_time, total_time) in rows[:limit]:
+            text = ""
+            if source_lines and line is not None and 0 < line <= len(source_lines):
+                text = source_lines[line - 1].strip()
+            out.append("    %-6s %-20s %11.3f %6.1f%% %11.3f  %s" % (
+                line if line is not None else "entry", name, self_time * 1000, self_time * 100 / total,
+                total_time * 1000, text))
+        return "\n".join(out)
+
+
+def frame_name(entry):
+    if entry.line is None:
+        return entry.name
+    return "%s:%d" % (entry.name, entry.line)
+
+
+class ProfilingCallStack(CallStack):
+    def __init__(self, profiler):
+        super().__init__()
+        self.profiler = profiler
+
+    def push(self, ar):
+        self._records.append(ar)
+        if ar.type == ARType.FUNCTION:
+            self.profiler.enter(ar.name)
+
+    def pop(self):
+        ar = self._records.pop()
+        if ar.type == ARType.FUNCTION:
+            self.profiler.leave()
+        return ar
+
+
+class ProfilingInterpreter(Interpreter):
+    """Interpreter reporting every statement it starts to a Profiler."""
+
+    def __init__(self, tree, memo=None, profiler=None):
+        super().__init__(tree, memo)
+        self.profiler = profiler or Profiler()
+        self.callstack = ProfilingCallStack(self.profiler)
+
+    def visit_StatesList(self, node):
+        line = self.profiler.line
+        for state in node.states:
+            line(state.line)
+            last = self.visit(state)
+            # a call or receive statement's value is not a return
+            if last != None and type(state) not in EXPR_STATEMENTS:
+                return last
+
+    def visit_ForStatement(self, node):
+        line = self.profiler.line
+        while True:
+            # the condition runs on the line of the for
+            line(node.line)
+            if not self.visit(node.cond):
+                break
+            last = self.visit(node.states)
+            if last != None:
+                return last
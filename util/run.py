@@ -0,0 +1,21 @@
+from util.interpreter import Interpreter
+from util.stack_interpreter import StackInterpreter
+from util.vm import VM
+from util.transpiler import PythonRunner
+from util.jit import JitInterpreter
+
+ENGINES = ("vm", "tree", "stack", "python", "jit")
+
+
+def execute(program, engine="vm", memo=None):
+    # `program` is the Module for the VM, the PythonModule for the Python
+    # backend and the analyzed tree for the other engines
+    if engine == "vm":
+        return VM(program, memo).run()
+    if engine == "stack":
+        return StackInterpreter(program, memo).run()
+    if engine == "python":
+        return PythonRunner(program, memo).run()
+    if engine == "jit":
+        return JitInterpreter(program, memo).run()
+    return Interpreter(program, memo).run()
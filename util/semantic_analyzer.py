@@ -1,12 +1,50 @@
 from collections import OrderedDict
 from enum import Enum
 from util.error import SemanticError, ErrorCode
+from util.lexer import Token, TokenType
+from util.parser import UnaryOp, FuncCall, Num, RetDecl, TYPED_FUNCS
+
+class ZeroValues(dict):
+    def __missing__(self, typename):
+        # channel types are spelled out, "chan int", and start out nil
+        if typename.startswith("chan "):
+            return None
+        raise KeyError(typename)
+
+# initial value of a declared variable, by type name
+ZERO_VALUES = ZeroValues({
+    "int": 0,
+    "float": 0.0,
+})
+
+# expressions made only of literals have no type until their context gives
+# them one, as Go's untyped constants; the value is the type they default to
+UNTYPED = {
+    "untyped int": "int",
+    "untyped float": "float",
+}
 
 class NodeVisitor:
+    # node type -> visit function, one table per visitor class
+    _dispatch = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+    
     def visit(self, node):
-        method = "visit_" + type(node).__name__
-        visitor = getattr(self, method, self.generic_visit)
-        return visitor(node)
+        try:
+            visitor = self._dispatch[type(node)]
+        except KeyError:
+            visitor = self._bind(type(node))
+        return visitor(self, node)
+    
+    @classmethod
+    def _bind(cls, node_type):
+        method = "visit_" + node_type.__name__
+        visitor = getattr(cls, method, cls.generic_visit)
+        cls._dispatch[node_type] = visitor
+        return visitor
 
     def generic_visit(self, node):
         raise Exception("[Semantic error] : No visit_%s method" % type(node).__name__)
@@ -14,9 +52,33 @@ class NodeVisitor:
 class SemanticAnalyzer(NodeVisitor):
     def __init__(self):
         self._init_scope()
+        # every function seen, and the one whose body is being visited
+        self.functions = []
+        self.cur_func = None
     
     def analyze(self, tree):
         self.visit(tree)
+        self.resolve_purity()
+    
+    def resolve_purity(self):
+        # A function is pure when it only touches its own frame and calls
+        # pure functions. Start from every candidate and drop the ones
+        # calling something impure until nothing changes, so recursion
+        # between pure functions keeps them pure.
+        for func_sym in self.functions:
+            func_sym.pure = not func_sym.outer_access and not func_sym.channels
+        changed = True
+        while changed:
+            changed = False
+            for func_sym in self.functions:
+                if func_sym.pure and not all(callee.pure for callee in func_sym.callees):
+                    func_sym.pure = False
+                    changed = True
+    
+    def note_access(self, sym):
+        # reading or writing a global or an enclosing function's variable
+        if self.cur_func is not None and sym.depth < self.cur_func.level:
+            self.cur_func.outer_access = True
         
     def _init_scope(self):
         self.cur_level = 0
@@ -45,6 +107,14 @@ class SemanticAnalyzer(NodeVisitor):
         self.cur_scope = scope
         
         self.visit(node.block)
+        node.nslots = scope.nslots
+        
+        main = scope.get("main", True)
+        if not isinstance(main, FuncSymbol):
+            self.abort(ErrorCode.ID_NOT_FOUND, "Function main can't found")
+        if main.arity:
+            self.abort(ErrorCode.MISMATCH_ERROR, "Function main must not take parameters")
+        node.main = main
         
         self.log("Exit Program")
         self.log(scope)
@@ -56,54 +126,95 @@ class SemanticAnalyzer(NodeVisitor):
     def visit_Block(self, node):
         for var in node.vardecls:
             self.visit(var)
+        # package level functions may be called before their declaration
         for func in node.functions:
-            self.visit(func)
+            self.declare_function(func)
+        for func in node.functions:
+            self.define_function(func)
         
     
     def visit_VarDecl(self, node):
         name = node.ident       
         if self.cur_scope.get(name, True):
             self.abort(ErrorCode.DUPLICATE_ID," Duplicate identifier '%s' found" % name)
-        val = self.cur_scope.get(node.type.text)
-        self.cur_scope.set(VarSymbol(name, val))
+        val = self.cur_scope.get(node.typename)
+        if val is None:
+            # "chan int", every channel type is built in
+            val = BuiltinTypeSymbol(node.typename)
+        var_sym = VarSymbol(name, val)
+        self.cur_scope.set(var_sym)
+        node.depth, node.slot = var_sym.depth, var_sym.slot
     
     def visit_FuncBlock(self, node):
+        # nested function, visible from its declaration on
+        self.declare_function(node)
+        self.define_function(node)
+    
+    def declare_function(self, node):
+        if self.cur_scope.get(node.name, True):
+            self.abort(ErrorCode.DUPLICATE_ID," Duplicate identifier '%s' found" % node.name)
+        func_sym = FuncSymbol(node.name, node.params,node.rettypes)
+        self.cur_scope.set(func_sym)
+        self.functions.append(func_sym)
+        node.func_sym = func_sym
+        
+        # set block for interpreter
+        func_sym.statementlist = node.statementlist
+    
+    def define_function(self, node):
         func_name = node.name
+        func_sym = node.func_sym
         self.log("Enter Scope %s" % func_name)
-        func_sym = FuncSymbol(func_name, node.params,node.rettypes)
-        self.cur_scope.set(func_sym)
         
         self.cur_level += 1
         scope = ScopedSymbolTable(func_name, self.cur_level, self.cur_scope)
         self.cur_scope = scope
+        func_sym.level = scope.scope_level
+        enclosing_func = self.cur_func
+        self.cur_func = func_sym
         
         
         # parameter
         for param in node.params:
-            vartype = self.cur_scope.get(param.type)
-            self.cur_scope.set(VarSymbol(param.ident, vartype))      
+            self.visit(param)
         
         # func block
         self.visit(node.statementlist)
+        states = node.statementlist.states
+        if func_sym.rettypes is not None and not (states and isinstance(states[-1], RetDecl)):
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : missing return at the end of function '%s' at line %d" % (
+                func_name, node.line))
         
         self.log(self.cur_scope)
         
+        # frame layout for interpreter, parameters take the first slots
+        func_sym.nslots = scope.nslots
+        func_sym.nlocals = scope.nslots - func_sym.arity
+        func_sym.varnames = scope.slot_names
+        
+        self.cur_func = enclosing_func
         self.cur_level -= 1
         self.cur_scope = self.cur_scope.enclosing_scope        
         self.log("Leave Scope %s" % func_name)
         
-        # set block for interpreter
-        func_sym.statementlist = node.statementlist
-        
 
     def visit_FuncCall(self, node):
-        # params count check
-        
-        for arg in node.args:
-            self.visit(arg)
+        argtypes = [self.visit(arg) for arg in node.args]
             
-        node.func_sym = self.cur_scope.get(node.name)
-        
+        func_sym = self.cur_scope.get(node.name)
+        if not isinstance(func_sym, FuncSymbol):
+            self.abort(ErrorCode.ID_NOT_FOUND,"NameError : Undefined function: '%s' at line %d" % (node.name, node.line))
+        if len(node.args) != func_sym.arity:
+            self.abort(ErrorCode.MISMATCH_ERROR,"ArgumentError : Function '%s' takes %d arguments but %d were given at line %d" % (
+                node.name, func_sym.arity, len(node.args), node.line))
+        for i, param in enumerate(func_sym.params):
+            node.args[i] = self.assign(node.args[i], argtypes[i], param.typename,
+                                       "argument %d of '%s'" % (i + 1, node.name))
+        node.func_sym = func_sym
+        node.type = func_sym.rettypes
+        if self.cur_func is not None:
+            self.cur_func.callees.add(func_sym)
+        return node.type
         
         
     def visit_StatesList(self, node):
@@ -111,11 +222,54 @@ class SemanticAnalyzer(NodeVisitor):
             self.visit(state)
         
     def visit_IfStatement(self, node):
+        self.visit(node.cond)
         self.visit(node.states)
         
     def visit_ForStatement(self, node):
+        self.visit(node.cond)
         self.visit(node.states)
         
+    def visit_ConditionOp(self, node):
+        optype, _ = self.operands(node)
+        optype = UNTYPED.get(optype, optype)
+        if optype not in TYPED_FUNCS and node.op.kind not in (TokenType.EQEQ, TokenType.NOTEQ):
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Operator %s not defined on %s at line %d" % (
+                node.op.text, optype, node.line))
+    
+    def visit_GoStatement(self, node):
+        self.visit(node.call)
+        self.note_channels()
+    
+    def visit_SendStatement(self, node):
+        chantype = self.channel(node.chan, "send to")
+        valtype = self.visit(node.value)
+        node.value = self.assign(node.value, valtype, chantype[len("chan "):], "send")
+    
+    def visit_RecvOp(self, node):
+        chantype = self.channel(node.chan, "receive from")
+        node.type = chantype[len("chan "):]
+        return node.type
+    
+    def visit_MakeChan(self, node):
+        if node.size is not None:
+            sizetype = self.visit(node.size)
+            node.size = self.assign(node.size, sizetype, "int", "make")
+        self.note_channels()
+        return node.type
+    
+    def channel(self, node, action):
+        chantype = self.value(node, self.visit(node))
+        if not chantype.startswith("chan "):
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Invalid operation: %s non-chan type %s at line %d" % (
+                action, chantype, node.line))
+        self.note_channels()
+        return chantype
+    
+    def note_channels(self):
+        # goroutines and channel operations are side effects
+        if self.cur_func is not None:
+            self.cur_func.channels = True
+        
     def visit_LabelDecl(self, node):
         pass
     
@@ -123,7 +277,21 @@ class SemanticAnalyzer(NodeVisitor):
         pass
     
     def visit_RetDecl(self, node): 
-        self.visit(node.val)
+        valtype = self.visit(node.val)
+        rettype = self.cur_func.rettypes
+        if rettype is None and self.cur_func.name == "main" and self.cur_func.level == 2:
+            # scripts report their result from a main declared without one
+            rettype = UNTYPED.get(self.value(node.val, valtype), valtype)
+        if rettype is None:
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Function '%s' has no result type but returns a value at line %d" % (
+                self.cur_func.name, node.line))
+        node.val = self.assign(node.val, valtype, rettype, "return")
+        
+        # "return f(...)", seen through the "+" placeholders of Parser.unary
+        val = node.val
+        while isinstance(val, UnaryOp) and val.opfunc is None:
+            val = val.right
+        node.tailcall = val if isinstance(val, FuncCall) else None
     
         # have_cnts =  len(node.val)
         # expected_cnts = len(self.cur_scope.enclosing_scope.get(self.cur_scope.scope_name).rettypes)
@@ -133,26 +301,115 @@ class SemanticAnalyzer(NodeVisitor):
     
     def visit_AssignOp(self, node):
         name = node.left
-        value = self.visit(node.right)
+        valtype = self.visit(node.right)
+        
+        sym = self.cur_scope.get(name)
+        if not isinstance(sym, VarSymbol):
+            self.abort(ErrorCode.ID_NOT_FOUND,"NameError : Undefined variable: '%s'" % name)
+        node.right = self.assign(node.right, valtype, sym.type.name, "assignment to '%s'" % name)
+        node.depth, node.slot = sym.depth, sym.slot
+        self.note_access(sym)
         
     def visit_UnaryOp(self, node):
-        self.visit(node.right)
+        valtype = self.value(node.right, self.visit(node.right))
+        if node.opfunc is not None and UNTYPED.get(valtype, valtype) not in TYPED_FUNCS:
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Operator %s not defined on %s at line %d" % (
+                node.op.text, valtype, node.line))
+        if isinstance(node.op, Token) and node.op.text in ZERO_VALUES:
+            # conversion
+            node.type = node.op.text
+            return node.type
+        node.type = UNTYPED.get(valtype, valtype)
+        return valtype
     
     
     def visit_BinOp(self, node):
-        self.visit(node.left)
-        self.visit(node.right)
+        optype, righttype = self.operands(node)
+        node.type = UNTYPED.get(optype, optype)
+        if node.type not in TYPED_FUNCS:
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Operator %s not defined on %s at line %d" % (
+                node.op.text, optype, node.line))
+        node.opfunc = TYPED_FUNCS[node.type][node.op.kind]
+        # fail on 1 / 0 and x / 0 now rather than at run time
+        if optype in UNTYPED:
+            self.constant(node)
+        elif righttype in UNTYPED and node.op.kind == TokenType.DIVID and self.constant(node.right) == 0:
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Division by constant zero at line %d" % node.line)
+        return optype
+    
+    def operands(self, node):
+        # static type shared by both operands of a BinOp or ConditionOp, and
+        # the type the right one had on its own
+        left = self.value(node.left, self.visit(node.left))
+        right = self.value(node.right, self.visit(node.right))
+        if left == right:
+            return left, right
+        if left in UNTYPED and right in UNTYPED:
+            # 1 + 2.5, Python already evaluates the int side exactly
+            return "untyped float", right
+        if left in UNTYPED:
+            node.left = self.convert(node.left, right)
+            return right, right
+        if right in UNTYPED:
+            node.right = self.convert(node.right, left)
+            return left, right
+        self.abort(ErrorCode.TYPE_ERROR,"TypeError : Mismatched types %s and %s at line %d" % (left, right, node.line))
+    
+    def value(self, node, valtype):
+        if valtype is None:
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : '%s' has no result, used as value at line %d" % (node.name, node.line))
+        return valtype
+    
+    def assign(self, node, valtype, target, context):
+        # the expression node to store into a `target` typed place
+        self.value(node, valtype)
+        if valtype == target:
+            return node
+        if valtype in UNTYPED:
+            return self.convert(node, target)
+        self.abort(ErrorCode.TYPE_ERROR,"TypeError : Cannot use %s value as %s in %s at line %d" % (
+            valtype, target, context, node.line))
+    
+    def convert(self, node, target):
+        # give an untyped constant the type of its context by evaluating it
+        # once, so 7 / 2 stays an integer division as in Go
+        if node.type == target:
+            return node
+        if target not in TYPED_FUNCS:
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Cannot use constant as %s at line %d" % (target, node.line))
+        value = self.constant(node)
+        if target == "int":
+            if value != int(value):
+                self.abort(ErrorCode.TYPE_ERROR,"TypeError : Constant %s truncated to int at line %d" % (value, node.line))
+            return Num(int(value), "int").at(node)
+        return Num(float(value), "float").at(node)
+    
+    def constant(self, node):
+        if isinstance(node, Num):
+            return node.value
+        if isinstance(node, UnaryOp):
+            value = self.constant(node.right)
+            return value if node.opfunc is None else node.opfunc(value)
+        left, right = self.constant(node.left), self.constant(node.right)
+        # float division gives an infinity at run time, constants fail as in Go
+        if node.op.kind == TokenType.DIVID and right == 0:
+            self.abort(ErrorCode.TYPE_ERROR,"TypeError : Division by constant zero at line %d" % node.line)
+        return node.opfunc(left, right)
             
             
     def visit_Ident(self, node):
         name = node.text
         
         sym = self.cur_scope.get(name)
-        if sym is None:
+        if not isinstance(sym, VarSymbol):
             self.abort(ErrorCode.ID_NOT_FOUND,"NameError : Undefined variable: '%s'" % name)
-        
+        node.depth, node.slot = sym.depth, sym.slot
+        self.note_access(sym)
+        node.type = sym.type.name
+        return node.type
+
     def visit_Num(self, node):
-        return node.value
+        return "untyped " + node.type
     
   
 class Symbol(object):
@@ -178,6 +435,9 @@ class VarSymbol(Symbol):
     
     def __init__(self, name, type):
         super().__init__(name, type)
+        # frame address, filled in when set into a scope
+        self.depth = None
+        self.slot = None
 
     def __str__(self):
         return "<{class_name}(name='{name}', type='{type}')>".format(
@@ -194,6 +454,18 @@ class FuncSymbol(Symbol):
         self.params = params
         self.rettypes = rettypes
         self.statementlist = None
+        # call descriptor, filled in by the SemanticAnalyzer: a frame holds
+        # `arity` arguments in its first slots, then `nlocals` variables
+        self.arity = len(params)
+        self.level = None
+        self.nslots = 0
+        self.nlocals = 0
+        self.varnames = []
+        # purity, see SemanticAnalyzer.resolve_purity
+        self.pure = False
+        self.outer_access = False
+        self.channels = False
+        self.callees = set()
         
     def __str__(self):
         return '<{class_name}(name={name}, parameters={params}, rettypes={rettypes})>'.format(
@@ -213,6 +485,8 @@ class ScopedSymbolTable(object):
         self.scope_name = scope_name
         self.scope_level = scope_level
         self.enclosing_scope = enclosing_scope
+        # variables of this scope are numbered in declaration order
+        self.slot_names = []
         
         
     def __str__(self):
@@ -238,7 +512,15 @@ class ScopedSymbolTable(object):
     
     __repr__ = __str__
     
+    @property
+    def nslots(self):
+        return len(self.slot_names)
+    
     def set(self, symbol):
+        if isinstance(symbol, VarSymbol):
+            symbol.depth = self.scope_level
+            symbol.slot = self.nslots
+            self.slot_names.append(symbol.name)
         self._symbols[symbol.name] = symbol
         
     def get(self, name, cur_scope_only = False):
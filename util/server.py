@@ -0,0 +1,188 @@
+import io
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import threading
+import contextlib
+import socketserver
+from collections import OrderedDict
+
+from util.lexer import RegexLexer
+from util.parser import Parser
+from util.semantic_analyzer import SemanticAnalyzer
+from util.optimizer import Optimizer
+from util.compiler import Compiler
+from util.transpiler import Transpiler
+from util.memo import MemoTable
+from util.error import Error
+from util.run import ENGINES, execute
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("TMPDIR", "/tmp"), "tinygo-%d.sock" % os.getuid())
+
+
+class ProgramCache:
+    """LRU of ready-to-run programs, the compiled Module for the VM, the
+    PythonModule for the Python backend or the analyzed tree for the other
+    engines, keyed by source hash and options."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._programs = OrderedDict()
+
+    def get(self, key):
+        program = self._programs.get(key)
+        if program is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._programs.move_to_end(key)
+        return program
+
+    def set(self, key, program):
+        self._programs[key] = program
+        if len(self._programs) > self.maxsize:
+            self._programs.popitem(last=False)
+
+    def __len__(self):
+        return len(self._programs)
+
+
+def build(filename, source, engine="vm", optimize=False):
+    tree = Parser(RegexLexer(filename, source + "\n")).parse()
+    SemanticAnalyzer().analyze(tree)
+    if optimize:
+        tree = Optimizer().optimize(tree)
+    if engine == "vm":
+        return Compiler(tree).compile()
+    if engine == "python":
+        return Transpiler(tree, filename).transpile()
+    return tree
+
+
+class Server:
+    """Run TinyGo programs for JSON requests, one object per line.
+
+    A request names the program by "path" or gives its "source", and may
+    set "id", "engine", "optimize", "memo" and "memo_size". The response
+    echoes "id" and has either "ok": true and the "result" of main(), or
+    "ok": false and an "error" with its "type", "code" and "message".
+    A request {"op": "stats"} reports the program cache counters.
+
+    Requests run at the same time on their own connections, only the
+    program cache is shared. There is no per-request timeout: interval
+    timers only interrupt the main thread, so a program that never ends
+    keeps its connection busy until the server is stopped.
+    """
+
+    def __init__(self, cache_size=128):
+        self.cache = ProgramCache(cache_size)
+        # the program cache is shared by all connections
+        self.lock = threading.Lock()
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            return {"id": None, "ok": False, "error": {"type": "BadRequest", "code": None, "message": str(e)}}
+        response = self.handle(request)
+        return dict(id=request.get("id"), **response)
+
+    def handle(self, request):
+        if request.get("op") == "stats":
+            with self.lock:
+                return {"ok": True, "programs": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses}
+
+        start = time.perf_counter()
+        try:
+            engine = request.get("engine", "vm")
+            if engine not in ENGINES:
+                raise ValueError("unknown engine %r" % engine)
+            optimize = bool(request.get("optimize", False))
+            if "source" in request:
+                filename = request.get("filename", "<request>")
+                source = request["source"]
+            elif "path" in request:
+                filename = request["path"]
+                with open(filename, "r") as f:
+                    source = f.read()
+            else:
+                raise ValueError("request needs a path or a source")
+
+            # the tree, stack and jit engines run the same analyzed tree
+            form = engine if engine in ("vm", "python") else "tree"
+            key = (hashlib.sha256(source.encode()).hexdigest(), form, optimize)
+            with self.lock:
+                program = self.cache.get(key)
+            cached = program is not None
+            if program is None:
+                # two requests may build the same program, the last one is kept
+                program = build(filename, source, engine, optimize)
+                with self.lock:
+                    self.cache.set(key, program)
+
+            memo = MemoTable(request.get("memo_size", 1024)) if request.get("memo") else None
+            result = execute(program, engine, memo)
+        except Error as e:
+            return self.failure(type(e).__name__, e.error_code, e.message)
+        except RecursionError:
+            return self.failure("RecursionError", None, "maximum recursion depth exceeded, try the vm or stack engine")
+        except Exception as e:
+            # e.g. a bad request, a missing file or an error of the program
+            return self.failure(type(e).__name__, None, str(e))
+        return {"ok": True, "result": result, "cached": cached, "seconds": time.perf_counter() - start}
+
+    def failure(self, type, code, message):
+        return {"ok": False, "error": {"type": type, "code": code, "message": message}}
+
+
+def serve_stdio(server, infile=None, outfile=None):
+    infile = infile or sys.stdin
+    outfile = outfile or sys.stdout
+    for line in infile:
+        if not line.strip():
+            continue
+        # anything the interpreters print must not end up in the protocol
+        with contextlib.redirect_stdout(sys.stderr):
+            response = server.handle_line(line)
+        outfile.write(json.dumps(response) + "\n")
+        outfile.flush()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in io.TextIOWrapper(self.rfile, encoding="utf-8"):
+            if not line.strip():
+                continue
+            response = self.server.tinygo.handle_line(line)
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_unix(server, path=DEFAULT_SOCKET):
+    if os.path.exists(path):
+        # refuse to take over the socket of a running server
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+        else:
+            probe.close()
+            raise OSError("a server is already listening on %s" % path)
+    with UnixServer(path, RequestHandler) as unix_server:
+        unix_server.tinygo = server
+        try:
+            unix_server.serve_forever()
+        finally:
+            os.remove(path)
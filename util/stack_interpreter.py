@@ -0,0 +1,279 @@
+from util.interpreter import *
+from util.goroutine import Goroutine, Scheduler, Channel, BLOCKED, deadlock, make_channel_error
+
+# continuation kinds, what to do with a node taken off Frame.todo
+EVAL = 0
+APPLY_BINARY = 1
+APPLY_UNARY = 2
+STORE = 3
+BRANCH = 4
+LOOP = 5
+CALL = 6
+TAIL_CALL = 7
+RETURN = 8
+DISCARD = 9
+GO = 10
+SEND = 11
+RECEIVE = 12
+MAKE = 13
+
+
+class Frame(ActivationRecord):
+    """ActivationRecord that also holds its own continuation and operand stacks.
+
+    `todo` plays the part of the program counter: the loop in
+    StackInterpreter.run pops the next (kind, node) pair from it.
+    """
+
+    def __init__(self, name, type, nested_level, size=0, enclosing=None, varnames=None, slots=None, body=None):
+        super().__init__(name, type, nested_level, size, enclosing, varnames, slots)
+        self.todo = [(EVAL, body)] if body is not None else []
+        self.values = []
+        # memo entries to fill with this frame's result
+        self.pending = None
+
+
+class StackInterpreter(Interpreter):
+    """Run the analyzed tree without recursing in Python.
+
+    Every TinyGo call pushes a Frame onto the CallStack and nested nodes are
+    expanded onto the frame's `todo` stack, so recursion depth is bounded
+    by memory only. Every goroutine has its own CallStack, so switching
+    goroutines is switching CallStacks; see Scheduler.
+    """
+
+    def interpret(self):
+        print(self.run())
+
+    def run(self):
+        program = self.tree
+        block = program.block
+        top = Frame(
+            name = program.package,
+            type = ARType.PROGRAM,
+            nested_level = 1,
+            size = program.nslots,
+        )
+        for var in block.vardecls:
+            top.slots[var.slot] = ZERO_VALUES[var.typename]
+        self.callstack.push(top)
+        self.scheduler = Scheduler()
+        main = self.goroutine = Goroutine(self.callstack)
+
+        self.start_call(program.main, [], top)
+        try:
+            if self.execute(1):
+                # main waits on a channel, run the others meanwhile
+                self.schedule(main)
+        except ZeroDivisionError:
+            raise divide_error() from None
+
+        self.callstack.pop()
+        return top.values.pop()
+
+    def schedule(self, main):
+        # until main returns, the others are abandoned then as in Go
+        ready = self.scheduler.ready
+        while True:
+            if not ready:
+                raise deadlock()
+            goroutine = self.goroutine = ready.popleft()
+            self.callstack = goroutine.callstack
+            if not self.execute(1) and goroutine is main:
+                return
+
+    def go(self, func_sym, args, enclosing):
+        callstack = CallStack()
+        # receives the result nobody reads
+        callstack.push(Frame(name="go " + func_sym.name, type=ARType.FUNCTION, nested_level=0))
+        current, self.callstack = self.callstack, callstack
+        try:
+            self.start_call(func_sym, args, enclosing)
+        finally:
+            self.callstack = current
+        self.scheduler.wake(Goroutine(callstack))
+
+    def start_call(self, func_sym, args, enclosing, pending=None):
+        caller = self.callstack.peek()
+        if self.memo is not None and func_sym.pure:
+            cache = self.memo.cache(func_sym, func_sym.name)
+            key = tuple(args)
+            ret = cache.get(key)
+            if ret is not MISSING:
+                return self.deliver(caller, ret, pending)
+            if pending is None:
+                pending = []
+            pending.append((cache, key))
+
+        frame = Frame(
+            name = func_sym.name,
+            type = ARType.FUNCTION,
+            nested_level = func_sym.level,
+            enclosing = enclosing,
+            varnames = func_sym.varnames,
+            slots = args + [None] * func_sym.nlocals,
+            body = func_sym.statementlist,
+        )
+        frame.pending = pending
+        self.callstack.push(frame)
+
+    def deliver(self, frame, value, pending):
+        if pending:
+            for cache, key in pending:
+                cache.set(key, value)
+        frame.values.append(value)
+
+    def finish(self, value):
+        frame = self.callstack.pop()
+        self.deliver(self.callstack.peek(), value, frame.pending)
+
+    def execute(self, depth):
+        # run until the CallStack is back to `depth` records, or return
+        # True when the goroutine has to wait on a channel or is preempted
+        callstack = self.callstack
+        ready = self.scheduler.ready
+        if len(callstack) <= depth:
+            return
+
+        while True:
+            ar = callstack.peek()
+            todo = ar.todo
+            values = ar.values
+            if not todo:
+                # fell off the end of the function
+                self.finish(None)
+                if len(callstack) <= depth:
+                    return
+                continue
+
+            kind, node = todo.pop()
+
+            if kind == EVAL:
+                node_type = type(node)
+                if node_type is Ident:
+                    if ar.nested_level != node.depth:
+                        values.append(ar.lookup(node.depth).slots[node.slot])
+                    else:
+                        values.append(ar.slots[node.slot])
+                elif node_type is Num:
+                    values.append(node.value)
+                elif node_type is BinOp or node_type is ConditionOp:
+                    todo.append((APPLY_BINARY, node))
+                    todo.append((EVAL, node.right))
+                    todo.append((EVAL, node.left))
+                elif node_type is UnaryOp:
+                    if node.opfunc is not None:
+                        todo.append((APPLY_UNARY, node))
+                    todo.append((EVAL, node.right))
+                elif node_type is FuncCall:
+                    todo.append((CALL, node))
+                    for arg in reversed(node.args):
+                        todo.append((EVAL, arg))
+                elif node_type is StatesList:
+                    for state in reversed(node.states):
+                        if type(state) in EXPR_STATEMENTS:
+                            todo.append((DISCARD, None))
+                        todo.append((EVAL, state))
+                elif node_type is AssignOp:
+                    todo.append((STORE, node))
+                    todo.append((EVAL, node.right))
+                elif node_type is IfStatement:
+                    todo.append((BRANCH, node))
+                    todo.append((EVAL, node.cond))
+                elif node_type is ForStatement:
+                    todo.append((LOOP, node))
+                    todo.append((EVAL, node.cond))
+                elif node_type is RetDecl:
+                    call = node.tailcall
+                    if call is not None:
+                        todo.append((TAIL_CALL, call))
+                        for arg in reversed(call.args):
+                            todo.append((EVAL, arg))
+                    else:
+                        todo.append((RETURN, None))
+                        todo.append((EVAL, node.val))
+                elif node_type is VarDecl:
+                    ar.slots[node.slot] = ZERO_VALUES[node.typename]
+                elif node_type is FuncBlock or node_type is LabelDecl or node_type is GotoDecl:
+                    pass
+                elif node_type is RecvOp:
+                    todo.append((RECEIVE, node))
+                    todo.append((EVAL, node.chan))
+                elif node_type is SendStatement:
+                    todo.append((SEND, node))
+                    todo.append((EVAL, node.value))
+                    todo.append((EVAL, node.chan))
+                elif node_type is GoStatement:
+                    todo.append((GO, node.call))
+                    for arg in reversed(node.call.args):
+                        todo.append((EVAL, arg))
+                elif node_type is MakeChan:
+                    todo.append((MAKE, node))
+                    if node.size is not None:
+                        todo.append((EVAL, node.size))
+                else:
+                    self.generic_visit(node)
+
+            elif kind == APPLY_BINARY:
+                right = values.pop()
+                values[-1] = node.opfunc(values[-1], right)
+            elif kind == APPLY_UNARY:
+                values[-1] = node.opfunc(values[-1])
+            elif kind == STORE:
+                target = ar if ar.nested_level == node.depth else ar.lookup(node.depth)
+                target.slots[node.slot] = values.pop()
+            elif kind == BRANCH:
+                if values.pop():
+                    todo.append((EVAL, node.states))
+            elif kind == LOOP:
+                if values.pop():
+                    # check the condition again once the body is done
+                    todo.append((EVAL, node))
+                    todo.append((EVAL, node.states))
+                    if ready and self.scheduler.preempt(self.goroutine):
+                        return True
+            elif kind == CALL:
+                func_sym = node.func_sym
+                nargs = func_sym.arity
+                args = values[len(values) - nargs:]
+                del values[len(values) - nargs:]
+                self.start_call(func_sym, args, ar.lookup(func_sym.level - 1))
+            elif kind == TAIL_CALL:
+                func_sym = node.func_sym
+                nargs = func_sym.arity
+                args = values[len(values) - nargs:]
+                enclosing = ar.lookup(func_sym.level - 1)
+                # the callee takes over this frame's place and memo entries
+                callstack.pop()
+                self.start_call(func_sym, args, enclosing, ar.pending)
+                if len(callstack) <= depth:
+                    return
+            elif kind == RETURN:
+                self.finish(values.pop())
+                if len(callstack) <= depth:
+                    return
+            elif kind == DISCARD:
+                values.pop()
+            elif kind == RECEIVE:
+                chan = values.pop()
+                # a nil channel blocks forever
+                value = BLOCKED if chan is None else chan.receive(self.goroutine)
+                if value is BLOCKED:
+                    return True
+                values.append(value)
+            elif kind == SEND:
+                value = values.pop()
+                chan = values.pop()
+                if chan is None or not chan.send(self.goroutine, value):
+                    return True
+            elif kind == GO:
+                func_sym = node.func_sym
+                nargs = func_sym.arity
+                args = values[len(values) - nargs:]
+                del values[len(values) - nargs:]
+                self.go(func_sym, args, ar.lookup(func_sym.level - 1))
+            elif kind == MAKE:
+                size = values.pop() if node.size is not None else 0
+                if size < 0:
+                    raise make_channel_error(size)
+                values.append(Channel(size, self.scheduler))
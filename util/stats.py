@@ -0,0 +1,189 @@
+import sys
+import time
+
+from util.lexer import TokenType
+from util.parser import IfStatement, ForStatement, FuncBlock
+from util.interpreter import Interpreter, CallStack, ARType
+from util.stack_interpreter import StackInterpreter
+from util.error import LexerError
+
+
+class PhaseTimer:
+    """Wall seconds, and optionally the net change in allocated memory
+    blocks, of consecutive named phases."""
+
+    def __init__(self, blocks=False):
+        self.phases = {}
+        self.blocks = {} if blocks else None
+        self.phase = None
+        self.last = time.perf_counter()
+        self.last_blocks = sys.getallocatedblocks() if blocks else 0
+
+    def start(self, phase):
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self.last
+        if self.blocks is not None:
+            blocks = sys.getallocatedblocks()
+            if self.phase is not None:
+                self.blocks[self.phase] = self.blocks.get(self.phase, 0) + blocks - self.last_blocks
+            self.last_blocks = blocks
+            # getallocatedblocks walks the heap, leave that out of the next phase
+            now = time.perf_counter()
+        self.phase = phase
+        self.last = now
+
+    def stop(self):
+        self.start(None)
+
+
+class TokenBuffer:
+    """Lex the whole source up front, then hand the tokens to the Parser.
+
+    The lexers are lazy, so without this their work is timed as parsing.
+    A LexerError is raised when the Parser reaches it, as it would be
+    without the buffer.
+    """
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.fname = lexer.fname
+        self.tokens = []
+        self.error = None
+        try:
+            while True:
+                token = lexer.getToken()
+                self.tokens.append(token)
+                if token.kind == TokenType.EOF:
+                    break
+        except LexerError as e:
+            self.error = e
+        self.tokens.reverse()
+
+    def getToken(self):
+        if self.tokens:
+            return self.tokens.pop()
+        if self.error is not None:
+            raise self.error
+        # past the end the lexer keeps returning EOF
+        return self.lexer.getToken()
+
+
+class CountingCallStack(CallStack):
+    def __init__(self):
+        super().__init__()
+        self.calls = {}
+        self.peak = 0
+
+    def push(self, ar):
+        self._records.append(ar)
+        if len(self._records) > self.peak:
+            self.peak = len(self._records)
+        if ar.type == ARType.FUNCTION:
+            self.calls[ar.name] = self.calls.get(ar.name, 0) + 1
+
+
+class CountingInterpreter(Interpreter):
+    """Interpreter counting visited nodes per type, calls per function,
+    iterations per ForStatement and the peak CallStack depth."""
+
+    def __init__(self, tree, memo=None):
+        super().__init__(tree, memo)
+        self.callstack = CountingCallStack()
+        self.nodes = {}
+        self.loops = {}
+
+    def visit(self, node):
+        name = type(node).__name__
+        self.nodes[name] = self.nodes.get(name, 0) + 1
+        return super().visit(node)
+
+    def visit_ForStatement(self, node):
+        iterations = 0
+        try:
+            while self.visit(node.cond):
+                iterations += 1
+                last = self.visit(node.states)
+                if last != None:
+                    return last
+        finally:
+            self.loops[node] = self.loops.get(node, 0) + iterations
+
+
+class CountingStackInterpreter(StackInterpreter):
+    """StackInterpreter counting calls per function and the peak CallStack
+    depth, its loop does not go through visit."""
+
+    def __init__(self, tree, memo=None):
+        super().__init__(tree, memo)
+        self.callstack = CountingCallStack()
+        self.nodes = None
+        self.loops = None
+
+
+def loop_names(tree):
+    """Name every ForStatement "<function> for#<n>", numbered in source order."""
+    names = {}
+
+    def walk(states, func, count):
+        for state in states.states:
+            if isinstance(state, ForStatement):
+                count[0] += 1
+                names[state] = "%s for#%d" % (func, count[0])
+                walk(state.states, func, count)
+            elif isinstance(state, IfStatement):
+                walk(state.states, func, count)
+            elif isinstance(state, FuncBlock):
+                walk(state.statementlist, state.name, [0])
+
+    for func in tree.block.functions:
+        walk(func.statementlist, func.name, [0])
+    return names
+
+
+class Stats:
+    """What --stats reports: the PhaseTimer of a run and the counters of
+    its interpreter, as a dict for JSON or as a table."""
+
+    def __init__(self, timer, interpreter=None, tree=None):
+        self.timer = timer
+        self.interpreter = interpreter
+        self.tree = tree
+
+    def to_dict(self):
+        timer = self.timer
+        stats = {
+            "phases": {
+                phase: {"seconds": seconds, "blocks": timer.blocks.get(phase) if timer.blocks is not None else None}
+                for phase, seconds in timer.phases.items()
+            },
+        }
+        interpreter = self.interpreter
+        if isinstance(interpreter, (CountingInterpreter, CountingStackInterpreter)):
+            stats["calls"] = dict(sorted(interpreter.callstack.calls.items(), key=lambda item: -item[1]))
+            stats["peak_depth"] = interpreter.callstack.peak
+            if interpreter.nodes is not None:
+                stats["nodes"] = dict(sorted(interpreter.nodes.items(), key=lambda item: -item[1]))
+            if interpreter.loops is not None:
+                names = loop_names(self.tree) if self.tree is not None else {}
+                stats["loops"] = {names.get(node, "for"): count for node, count in interpreter.loops.items()}
+        return stats
+
+    def format(self):
+        stats = self.to_dict()
+        lines = ["    %-12s %12s %14s" % ("phase", "ms", "net blocks")]
+        for phase, row in stats["phases"].items():
+            blocks = "-" if row["blocks"] is None else "%d" % row["blocks"]
+            lines.append("    %-12s %12.3f %14s" % (phase, row["seconds"] * 1000, blocks))
+        if "calls" not in stats:
+            lines.append("    (interpreter counters need --engine tree or stack)")
+            return "\n".join(lines)
+        lines.append("    peak call depth %d" % stats["peak_depth"])
+        for title, counts in (("calls", stats["calls"]), ("nodes", stats.get("nodes")),
+                              ("loop iterations", stats.get("loops"))):
+            if not counts:
+                continue
+            lines.append("    %s" % title)
+            for name, count in counts.items():
+                lines.append("        %-20s %12d" % (name, count))
+        return "\n".join(lines)
@@ -0,0 +1,358 @@
+import sys
+import math
+import keyword
+import contextlib
+
+from util.parser import *
+from util.semantic_analyzer import NodeVisitor, ZERO_VALUES
+from util.memo import MISSING
+from util.error import InterpretError, ErrorCode, divide_error
+
+# Python spelling of the TinyGo operators
+PY_OPS = {
+    TokenType.PLUS: "+",
+    TokenType.MINUS: "-",
+    TokenType.MULTI: "*",
+    TokenType.DIVID: "/",
+    TokenType.EQEQ: "==",
+    TokenType.NOTEQ: "!=",
+    TokenType.GT: ">",
+    TokenType.GTEQ: ">=",
+    TokenType.LT: "<",
+    TokenType.LTEQ: "<=",
+}
+
+# binding strength, the same in Go and Python
+PRECEDENCE = {
+    TokenType.PLUS: 1,
+    TokenType.MINUS: 1,
+    TokenType.MULTI: 2,
+    TokenType.DIVID: 2,
+}
+
+
+class PythonModule:
+    """Python source generated from an analyzed Program.
+
+    Code objects don't pickle, so the module keeps the source for TreeCache
+    and PythonRunner compiles it.
+    """
+
+    def __init__(self, filename, source, main, pure):
+        self.filename = filename
+        self.source = source
+        # Python name of main()
+        self.main = main
+        # (Python name, TinyGo name) of every pure package level function
+        self.pure = pure
+
+    def __str__(self):
+        return self.source
+
+
+class Transpiler(NodeVisitor):
+    """Translate an analyzed Program into Python source, one def per FuncBlock.
+
+    TinyGo variables become Python locals, closure cells of nested defs or
+    module globals. TinyGo names have no "_", so generated names containing
+    one never collide with them: a keyword gets a "_" suffix and a name
+    shadowing one of an enclosing scope gets "_<level>".
+    """
+
+    def __init__(self, tree, filename="<tinygo>"):
+        self.tree = tree
+        self.filename = filename
+        self.lines = []
+        self.indent = 0
+        # TinyGo name -> Python name, one dict per scope level, [0] the package
+        self.scopes = []
+        # names the function being generated assigns in outer scopes
+        self.globals = None
+        self.nonlocals = None
+        # FuncSymbol whose self tail calls loop instead of recursing, and the
+        # depth of for loops in it, a "continue" there would hit those
+        self.tail = None
+        self.loops = 0
+
+    def transpile(self):
+        self.visit(self.tree)
+        return PythonModule(
+            "<tinygo %s>" % self.filename,
+            "\n".join(self.lines) + "\n",
+            self.scopes[0][self.tree.main.name],
+            [(self.scopes[0][func.name], func.name) for func in self.tree.block.functions if func.func_sym.pure],
+        )
+
+    def emit(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def bind(self, scope, name):
+        pyname = name + "_" if keyword.iskeyword(name) else name
+        if any(name in outer for outer in self.scopes[:-1]):
+            pyname = "%s_%d" % (name, len(self.scopes))
+        scope[name] = pyname
+        return pyname
+
+    def visit_Program(self, node):
+        package = {}
+        self.scopes.append(package)
+        block = node.block
+        for var in block.vardecls:
+            self.bind(package, var.ident)
+        for func in block.functions:
+            self.bind(package, func.name)
+
+        self.emit("# generated from %s by the TinyGo Python backend" % self.filename)
+        for var in block.vardecls:
+            self.emit("%s = %r" % (package[var.ident], ZERO_VALUES[var.typename]))
+        for func in block.functions:
+            self.emit("")
+            self.emit("")
+            self.visit(func)
+
+    def visit_FuncBlock(self, node):
+        func_sym = node.func_sym
+        # package level functions are bound up front, nested ones where they appear
+        name = self.scopes[-1].get(node.name) if len(self.scopes) == 1 else self.bind(self.scopes[-1], node.name)
+        scope = {}
+        self.scopes.append(scope)
+        for var in func_sym.varnames:
+            self.bind(scope, var)
+        enclosing = self.globals, self.nonlocals, self.tail, self.loops
+        self.globals, self.nonlocals = set(), set()
+        self.tail = func_sym if has_self_tail_call(node.statementlist, func_sym) else None
+        self.loops = 0
+
+        self.emit("def %s(%s):" % (name, ", ".join(scope[param.ident] for param in node.params)))
+        self.indent += 1
+        start = len(self.lines)
+        if self.tail is not None:
+            # return f(...) rebinds the parameters and starts over
+            self.emit("while True:")
+            self.indent += 1
+            self.visit(node.statementlist)
+            states = node.statementlist.states
+            if not states or not isinstance(states[-1], RetDecl):
+                self.emit("return None")
+            self.indent -= 1
+        else:
+            self.visit(node.statementlist)
+        decls = []
+        if self.globals:
+            decls.append("global %s" % ", ".join(sorted(self.globals)))
+        if self.nonlocals:
+            decls.append("nonlocal %s" % ", ".join(sorted(self.nonlocals)))
+        self.lines[start:start] = ["    " * self.indent + decl for decl in decls]
+        if len(self.lines) == start:
+            self.emit("pass")
+        self.indent -= 1
+
+        self.globals, self.nonlocals, self.tail, self.loops = enclosing
+        self.scopes.pop()
+
+    def body(self, states):
+        self.indent += 1
+        start = len(self.lines)
+        self.visit(states)
+        if len(self.lines) == start:
+            self.emit("pass")
+        self.indent -= 1
+
+    def visit_StatesList(self, node):
+        for state in node.states:
+            if type(state) is FuncCall:
+                # a call statement, its result is dropped
+                self.emit(self.visit(state))
+            else:
+                self.visit(state)
+
+    def visit_VarDecl(self, node):
+        self.emit("%s = %r" % (self.scopes[node.depth - 1][node.ident], ZERO_VALUES[node.typename]))
+
+    def visit_AssignOp(self, node):
+        pyname = self.scopes[node.depth - 1][node.left]
+        if node.depth == 1:
+            self.globals.add(pyname)
+        elif node.depth != len(self.scopes):
+            self.nonlocals.add(pyname)
+        self.emit("%s = %s" % (pyname, self.visit(node.right)))
+
+    def visit_IfStatement(self, node):
+        self.emit("if %s:" % self.visit(node.cond))
+        self.body(node.states)
+
+    def visit_ForStatement(self, node):
+        self.emit("while %s:" % self.visit(node.cond))
+        self.loops += 1
+        self.body(node.states)
+        self.loops -= 1
+
+    def visit_RetDecl(self, node):
+        call = node.tailcall
+        if call is not None and call.func_sym is self.tail and not self.loops:
+            params = [self.scopes[-1][param.ident] for param in self.tail.params]
+            if params:
+                self.emit("%s = %s" % (", ".join(params), ", ".join(self.visit(arg) for arg in call.args)))
+            self.emit("continue")
+            return
+        self.emit("return %s" % self.visit(node.val))
+
+    def visit_LabelDecl(self, node):
+        pass
+
+    def visit_GotoDecl(self, node):
+        pass
+
+    def visit_GoStatement(self, node):
+        raise InterpretError(
+            error_code=ErrorCode.SYNTAX_ERROR.value,
+            message="Goroutines and channels are not supported at line %d, run with --engine stack, tree or jit" % node.line
+        )
+
+    visit_SendStatement = visit_RecvOp = visit_MakeChan = visit_GoStatement
+
+    # expressions return their Python source
+
+    def visit_FuncCall(self, node):
+        func_sym = node.func_sym
+        return "%s(%s)" % (self.scopes[func_sym.level - 2][func_sym.name],
+                           ", ".join(self.visit(arg) for arg in node.args))
+
+    def visit_ConditionOp(self, node):
+        return "%s %s %s" % (self.visit(node.left), PY_OPS[node.op.kind], self.visit(node.right))
+
+    def visit_BinOp(self, node):
+        precedence = PRECEDENCE[node.op.kind]
+        left = self.operand(node.left, precedence)
+        right = self.operand(node.right, precedence + 1)
+        if is_int_div(node):
+            # truncate toward zero like util.parser.int_div, inline when
+            # the divisor can be evaluated twice
+            if not is_simple(node.right):
+                return "int_div(%s, %s)" % (self.visit(node.left), self.visit(node.right))
+            if is_simple(node.left):
+                return "(_q if (_q := %s // %s) >= 0 or _q * %s == %s else _q + 1)" % (left, right, right, left)
+            return "(_q if (_q := (_a := %s) // %s) >= 0 or _q * %s == _a else _q + 1)" % (left, right, right)
+        if node.op.kind == TokenType.DIVID and not is_nonzero(node.right):
+            # an infinity or NaN like util.parser.float_div, inline when
+            # the left operand can be evaluated after the divisor
+            if is_simple(node.right):
+                return "(%s / %s if %s else float_div(%s, %s))" % (left, right, right, left, right)
+            if is_simple(node.left):
+                return "(%s / _d if (_d := %s) else float_div(%s, _d))" % (left, self.visit(node.right), left)
+            return "float_div(%s, %s)" % (self.visit(node.left), self.visit(node.right))
+        return "%s %s %s" % (left, PY_OPS[node.op.kind], right)
+
+    def visit_UnaryOp(self, node):
+        if node.opfunc is None:
+            return self.visit(node.right)
+        if isinstance(node.op, Token) and node.op.kind in (TokenType.INT, TokenType.FLOAT):
+            return "%s(%s)" % (node.op.text, self.visit(node.right))
+        return "-%s" % self.operand(node.right, 3)
+
+    def operand(self, node, precedence):
+        # in parentheses unless it binds at least as tightly as `precedence`,
+        # the right operand of a - b asks for more so a - (b - c) keeps them
+        text = self.visit(node)
+        inner = skip_plus(node)
+        if isinstance(inner, BinOp) and not is_int_div(inner):
+            if PRECEDENCE[inner.op.kind] >= precedence:
+                return text
+        elif not text.startswith("-"):
+            return text
+        return "(%s)" % text
+
+    def visit_Ident(self, node):
+        return self.scopes[node.depth - 1][node.text]
+
+    def visit_Num(self, node):
+        if not math.isfinite(node.value):
+            # folded from a division by zero, repr gives the bare name inf
+            return "float(%r)" % repr(node.value)
+        return repr(node.value)
+
+
+def has_self_tail_call(states, func_sym):
+    # outside for loops and nested functions, see Transpiler.visit_RetDecl
+    for state in states.states:
+        if isinstance(state, RetDecl):
+            if state.tailcall is not None and state.tailcall.func_sym is func_sym:
+                return True
+        elif isinstance(state, IfStatement):
+            if has_self_tail_call(state.states, func_sym):
+                return True
+    return False
+
+
+def skip_plus(node):
+    # the "+" placeholders Parser.unary wraps around every primary
+    while isinstance(node, UnaryOp) and node.opfunc is None:
+        node = node.right
+    return node
+
+
+def is_int_div(node):
+    return isinstance(node, BinOp) and node.type == "int" and node.op.kind == TokenType.DIVID
+
+
+def is_nonzero(node):
+    node = skip_plus(node)
+    return isinstance(node, Num) and node.value != 0
+
+
+def is_simple(node):
+    # a name or a literal, cheap and free of side effects
+    node = skip_plus(node)
+    return isinstance(node, Ident) or isinstance(node, Num) and node.value >= 0
+
+
+def memoize(func, cache):
+    def call(*args):
+        ret = cache.get(args)
+        if ret is MISSING:
+            ret = func(*args)
+            cache.set(args, ret)
+        return ret
+    return call
+
+
+# Python frames allowed while generated or jit compiled code runs, one or
+# a few per TinyGo call; CPython 3.11 keeps Python to Python calls off the C stack
+RECURSION_LIMIT = 100000
+
+
+@contextlib.contextmanager
+def recursion_limit(limit):
+    saved = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, saved))
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(saved)
+
+
+class PythonRunner:
+    """Compile a PythonModule with compile() and call its main()."""
+
+    def __init__(self, module, memo=None):
+        self.module = module
+        # MemoTable caching the results of pure functions, or None
+        self.memo = memo
+
+    def interpret(self):
+        print(self.run())
+
+    def run(self):
+        module = self.module
+        code = compile(module.source, module.filename, "exec")
+        namespace = {"__name__": "tinygo", "int_div": int_div, "float_div": float_div}
+        exec(code, namespace)
+        if self.memo is not None:
+            # recursive calls look the name up in the module, so they hit the cache too
+            for pyname, name in module.pure:
+                namespace[pyname] = memoize(namespace[pyname], self.memo.cache(pyname, name))
+        try:
+            with recursion_limit(RECURSION_LIMIT):
+                return namespace[module.main]()
+        except ZeroDivisionError:
+            raise divide_error() from None
@@ -0,0 +1,166 @@
+from util.compiler import *
+from util.error import InterpretError, ErrorCode, divide_error
+from util.memo import MISSING
+from util.parser import float_div
+
+
+class VM:
+    """Stack machine running a compiled Module.
+
+    TinyGo calls push a frame onto an explicit frame list instead of
+    recursing in Python, and every instruction is dispatched inside one loop.
+    """
+
+    def __init__(self, module, memo=None):
+        self.module = module
+        self.globals = list(module.global_values)
+        # MemoTable caching the results of pure functions, or None
+        self.memo = memo
+
+    def abort(self, error_code, msg):
+        raise InterpretError(
+            error_code=error_code.value,
+            message=msg
+        )
+
+    def interpret(self):
+        print(self.run())
+
+    def run(self):
+        try:
+            return self.call(self.module.main, [])
+        except ZeroDivisionError:
+            raise divide_error() from None
+
+    def call(self, index, args):
+        functions = self.module.functions
+        glob = self.globals
+        memo = self.memo
+
+        func = functions[index]
+        code = func.code
+        consts = func.consts
+        local = args + [None] * (func.nlocals - len(args))
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        pc = 0
+        # (cache, key) receiving the result of the running frame
+        pending = None
+
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+
+            if op == LOAD_LOCAL:
+                push(local[arg])
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == STORE_LOCAL:
+                local[arg] = pop()
+            elif op == ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == DIV:
+                right = pop()
+                # floats only, see float_div
+                stack[-1] = stack[-1] / right if right else float_div(stack[-1], right)
+            elif op == INT_DIV:
+                right = pop()
+                left = stack[-1]
+                # truncate toward zero, see int_div
+                quotient = left // right
+                if quotient < 0 and quotient * right != left:
+                    quotient += 1
+                stack[-1] = quotient
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == CMP_LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == CMP_LE:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+            elif op == CMP_EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == CMP_NE:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == CMP_GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == CMP_GE:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+            elif op == CALL or op == TAIL_CALL:
+                callee = functions[arg]
+                nparams = callee.nparams
+                if nparams:
+                    new_local = stack[-nparams:]
+                    del stack[-nparams:]
+                else:
+                    new_local = []
+                if op == TAIL_CALL and pending is None and not (memo is not None and callee.pure):
+                    # reuse the current frame, the caller's RETURN is never reached
+                    new_local.extend([None] * (callee.nlocals - nparams))
+                    code = callee.code
+                    consts = callee.consts
+                    local = new_local
+                    pc = 0
+                    continue
+                if memo is not None and callee.pure:
+                    cache = memo.cache(arg, callee.name)
+                    key = tuple(new_local)
+                    ret = cache.get(key)
+                    if ret is not MISSING:
+                        push(ret)
+                        continue
+                    frames.append((code, consts, local, stack, pc, pending))
+                    pending = (cache, key)
+                else:
+                    frames.append((code, consts, local, stack, pc, pending))
+                    pending = None
+                new_local.extend([None] * (callee.nlocals - nparams))
+                code = callee.code
+                consts = callee.consts
+                local = new_local
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                pc = 0
+            elif op == RETURN:
+                ret = pop()
+                if pending is not None:
+                    pending[0].set(pending[1], ret)
+                if not frames:
+                    return ret
+                code, consts, local, stack, pc, pending = frames.pop()
+                push = stack.append
+                pop = stack.pop
+                push(ret)
+            elif op == POP:
+                pop()
+            elif op == NEG:
+                stack[-1] = -stack[-1]
+            elif op == TO_INT:
+                stack[-1] = int(stack[-1])
+            elif op == TO_FLOAT:
+                stack[-1] = float(stack[-1])
+            elif op == LOAD_GLOBAL:
+                push(glob[arg])
+            elif op == STORE_GLOBAL:
+                glob[arg] = pop()
+            else:
+                self.abort(ErrorCode.SYNTAX_ERROR, "Unknown opcode %d" % op)